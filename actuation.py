@@ -0,0 +1,68 @@
+"""
+Actuation queues: the robot servers do not touch the robots while the world is being simulated.
+
+The actuation commands (WHEELS, GRAB, SHOOT) are put on a per-robot queue, each stamped with the tick it takes effect
+at, and a world task applies them at the start of that step, in the simulation thread. So a grab never runs into a ball
+being removed from world.objects, and the robots' locks are not contended by the physics loop.
+A command received while world.tick is T takes effect at the start of the step during which world.tick is T + 1:
+the step T may already be under way, and its tasks done. The reply to the command is this tick.
+The queue is a collections.deque, whose append and popleft are atomic, so it needs no lock. The commands of one
+connection are applied in order, and those of several connections in the order they were received.
+The commands are also stamped with the match (world.match), so those received before a reset are dropped.
+The queue belongs to the robot (see queue_of) and holds the commands by name, so a checkpoint can save and restore it.
+"""
+import collections
+
+class ActuationQueue:
+	"""
+	Commands for one robot, applied by a world task.
+	>>> from world import World
+	>>> w = World()
+	>>> q = ActuationQueue(w)
+	>>> done = []
+	>>> q.actions["WHEELS"] = lambda *args: done.append(args)
+	>>> q.attach()
+	>>> q.put("WHEELS", 10, 20)
+	1
+	>>> w.simulate()
+	>>> done
+	[]
+	>>> w.simulate()
+	>>> done
+	[(10, 20)]
+	>>> q.put("WHEELS", 0, 0)
+	3
+	>>> w.match += 1		# As World.reset does
+	>>> w.simulate(); w.simulate()
+	>>> done
+	[(10, 20)]
+	"""
+	def __init__(self, world):
+		self.world = world
+		self.queue = collections.deque()	# (tick, match, name, args)
+		self.actions = {}					# name -> function, set up by the robot server
+
+	def attach(self):
+		self.world.tasks.append(self.apply)
+
+	def put(self, name, *args):
+		"Queues the action name(*args) and returns the tick at which it is applied. Never blocks, may be called from any thread."
+		tick = self.world.tick + 1
+		self.queue.append((tick, self.world.match, name, args))
+		return tick
+
+	def apply(self):
+		"Applies the commands due at the current tick, and drops those of an earlier match"
+		tick, match = self.world.tick, self.world.match
+		q = self.queue
+		while len(q) > 0 and q[0][0] <= tick:
+			t, m, name, args = q.popleft()
+			if m == match:
+				self.actions[name](*args)
+		return True		# Keep running as a world task
+
+def queue_of(robot):
+	"The robot's ActuationQueue, created on first use (by its server, or by Checkpoint.restore before the server exists)"
+	if getattr(robot, 'actuation', None) is None:
+		robot.actuation = ActuationQueue(robot.world)
+	return robot.actuation
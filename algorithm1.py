@@ -1,20 +1,80 @@
-import socket, sys
+import sys
 import time, random
+from client import RobotClient
+from tracker import BallTracker
 
 class Algorithm:
-	def __init__(self, port):
+	"""
+	In lockstep mode (see lockstep.py) the controller lives in simulated time: sleep() lets the simulation
+	run for the given time and now() is the simulation tick in seconds. Otherwise both use the wall clock.
+	The camera is read every cam_interval seconds (0 = on every ball() call), see ball().
+	Whether the simulator has been reset (a new match) is checked every MATCH_INTERVAL seconds, see new_match().
+	The random decisions are drawn from self.random, seeded with seed (None = from the system), so that lockstep runs
+	can be repeated exactly.
+	"""
+	MATCH_INTERVAL = 0.1
+
+	def __init__(self, port, lockstep=False, cam_interval=0, seed=None):
 		self.port = port
-		self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		self.socket.connect(('localhost', port))
+		self.random = random.Random(seed)
+		self.client = RobotClient(port)
+		self.lockstep = lockstep
+		self.tick = self.client.tick() if lockstep else 0
+		self.cam_interval = cam_interval
+		self.tracker = BallTracker()
+		self.last_cam = None
+		self.match = self.client.match()
+		self.last_match_check = self.now()
+
+	def now(self):
+		if self.lockstep:
+			return self.tick/1000.0
+		return time.time()
+
+	def sleep(self, seconds):
+		if self.lockstep:
+			self.tick = self.client.step(max(1, int(seconds*1000)))
+		else:
+			time.sleep(seconds)
 
 	def command(self, cmd):
-		self.socket.send(cmd)
-		result = self.socket.recv(1024)
-		return result
+		return self.client.command(cmd)
+
+	def ball(self):
+		"(distance, left) of the ball or None: the camera reading filtered by the tracker, predicted between the readings"
+		now = self.now()
+		if self.last_cam is None or now - self.last_cam >= self.cam_interval:
+			self.tracker.update(now*1000, self.client.cam())
+			self.last_cam = now
+		return self.tracker.estimate(now*1000)
+
+	def wheels(self, left, right):
+		self.client.wheels(left, right)
+		self.tracker.wheels(self.now()*1000, left, right)
+
+	def forget(self):
+		"Makes the next ball() read the camera afresh, e.g. when the robot has moved in a way the tracker does not know"
+		self.tracker.lose()
+		self.last_cam = None
+
+	def new_match(self):
+		"Whether the simulator has started a new match since the last check. Then the robot is stopped at its starting pose."
+		now = self.now()
+		if now - self.last_match_check < self.MATCH_INTERVAL:
+			return False
+		self.last_match_check = now
+		match = self.client.match()
+		if match == self.match:
+			return False
+		self.match = match
+		self.tracker.wheels(now*1000, 0, 0)
+		self.forget()
+		return True
 
 class State:
 	def __init__(self, a):
 		self.a = a
+		self.client = a.client
 	def command(self, cmd):
 		return self.a.command(cmd)
 	def next(self, state):
@@ -23,7 +83,7 @@ class State:
 class StateStop(State):
 	# The stopped state
 	def step(self):
-		self.command("WHEELS 0 0")
+		self.a.wheels(0, 0)
 
 class StateApproaching(State):
 	# Assuming the ball is right in front, approaches it until the distance goes down to 30
@@ -31,33 +91,35 @@ class StateApproaching(State):
 	# If ball lost, shifts to Searching
 	# When approach complete, shifts to stop
 	def step(self):
-		v = self.command("CAM")
-		if v == "0 0\n":
+		v = self.a.ball()
+		if v is None:
 			# Lost the ball!
 			print "Lost the ball, going to search again"
 			self.next(StateSearching(self.a))
 		else:
-			dist, left = map(float, v.split())
+			dist, left = v
 			print "Distance: %f" % dist
 			if abs(left) > 5:
 				print "Lost rotation, going to rotate again"
 				self.next(StateRotating(self.a))
 			if dist < 30:
 				print "Approach complete, grabbing and turning until we see the beacon"
-				time.sleep(0.1) # Wait just a bit before we grab
-				self.command("GRAB")
-				self.command("WHEELS 10 -10") # Start turning
-				bcn = self.command("BEACON")
-				if (int(bcn) == 1):
+				self.a.sleep(0.1) # Wait just a bit before we grab
+				self.client.grab()
+				self.a.forget()
+				self.a.wheels(10, -10) # Start turning
+				bcn = self.client.beacon()
+				# Depending on the robot, BEACON is either 1/0 or the (forward, left, ...) offsets of the beacon
+				if bcn is True or (isinstance(bcn, tuple) and bcn[0] != 5000 and abs(bcn[1]) < 5):
 					print "Found beacon, shoot!"
-					self.command("SHOOT")
-					self.command("WHEELS 0 0")
-					time.sleep(0.5)
+					self.client.shoot()
+					self.a.wheels(0, 0)
+					self.a.sleep(0.5)
 					print "Now go looking for another ball"
 					self.next(StateSearching(self.a))
 			else:
 				print "Continuing approach"
-				self.command("WHEELS 40 40")
+				self.a.wheels(40, 40)
 	
 class StateRotating(State):
 	# Assumes the ball is in the cam. Rotates to get it to the middle.
@@ -65,62 +127,70 @@ class StateRotating(State):
 	# Note, this may not be a good idea in practice, as it is possible that while rotating another
 	# ball will be detected and the original ball is lost
 	
+	# The rotation loop runs on the server at every simulation step (see behaviours.py)
+	ROTATE = "5000; NOT CAM -> DONE; ABS CAM.left < 3 -> DONE; CAM.left > 0 -> WHEELS 20 -20; ALWAYS -> WHEELS -20 20"
+	
 	def step(self):
-		v = self.command("CAM")
-		if v == "0 0\n":
+		result = self.client.behaviour(self.ROTATE).split()
+		self.a.forget()	# The behaviour has turned the robot
+		if result[0] == "DONE" and result[1] == "2":	# OK, rotated!
+			print "Rotation complete, approaching..."
+			self.next(StateApproaching(self.a))
+		else:
 			# Lost the ball!
 			print "Lost the ball, going to search again"
 			self.next(StateSearching(self.a))
-		else:
-			left = float(v.split()[1])
-			if abs(left) < 3:	# OK, rotated!
-				print "Rotation complete, approaching..."
-				self.next(StateApproaching(self.a))
-			else:
-				# Set wheel speed according to the side
-				sgn = 1 if left > 0 else -1
-				self.command("WHEELS %d %d" % (sgn*20, -sgn*20))
 
 class StateSearching(State):
 	# The searching state - robot will hectically wander along the field until it finds a ball in the cam
 	# Once ball found, shifts to "rotating" state
 	def __init__(self, a):
-		self.a = a
+		State.__init__(self, a)
 		self.last_change = 0
 		
 	def step(self):
 		# Check the cam
-		v = self.command("CAM")
+		v = self.a.ball()
 		# Do we see anything?
-		if v != "0 0\n":
+		if v is not None:
 			# Yay, now rotate in position
 			print "Ball found, now rotate in position.."
 			self.next(StateRotating(self.a))
 		else:
 			# Keep wandering...
-			curtime = time.time()
+			curtime = self.a.now()
 			if (curtime - self.last_change > 2):
 				# Change direction
-				self.command("WHEELS %d %d\n" % (random.randint(-10,100), random.randint(-10,100)))				
+				self.a.wheels(self.a.random.randint(-10,100), self.a.random.randint(-10,100))
 				self.last_change = curtime
-		time.sleep(0.001)
 	
 class Algorithm1(Algorithm):
-	def __init__(self, port):
-		Algorithm.__init__(self, port)
+	def __init__(self, port, lockstep=False, cam_interval=0, seed=None):
+		Algorithm.__init__(self, port, lockstep, cam_interval, seed)
 		self.state = StateSearching(self)
 	def run(self):
 		print "Running algorithm"
-		while 1:
-			self.state.step()
+		try:
+			while 1:
+				if self.new_match():
+					print "New match, going to search again"
+					self.state = StateSearching(self)
+				self.state.step()
+				self.sleep(0.001)
+		except KeyboardInterrupt:
+			print self.client.stats.report()
 	
 def main():
 	try:
 		port = int(sys.argv[1])
+		lockstep = "lockstep" in sys.argv[2:]
+		args = [a for a in sys.argv[2:] if a != "lockstep"]
+		cam_interval = float(args[0])/1000 if len(args) > 0 else 0.05
+		seed = int(args[1]) if len(args) > 1 else None
 	except:
-		print "Usage: ./algorithm.py <port>"
+		print "Usage: ./algorithm.py <port> [lockstep] [camera interval in ms, default 50] [random seed]"
 		return
-	a = Algorithm1(port)
+	a = Algorithm1(port, lockstep, cam_interval, seed)
 	a.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,175 @@
+"""
+Server-side robot behaviours.
+
+A behaviour is a small declarative program which the RobotServer runs inside the simulation, once per step,
+so that tight reactive loops ("rotate until the ball is in the middle") need no network round-trips.
+The client sends it as a single BEHAVIOR command:
+  BEHAVIOR <timeout ms> ; <rule> ; <rule> ; ...
+  rule      := <condition> -> <action> [, <action> ...]
+  condition := <term> [AND <term> ...]
+  term      := ALWAYS | [NOT] <sensor> | [ABS] <sensor>.<field> <op> <number>
+  sensor    := CAM | BEACON | GOAL | OPTO      (field: dist, left or an index into the reply)
+  op        := < | > | <= | >=
+  action    := WHEELS l r | GRAB | SHOOT | DONE      (only the robot commands which do not block the simulation)
+On every step the first rule whose condition holds is the active one. Its actions are executed when
+it becomes active (not again on every step while it stays active). The behaviour finishes when an
+active rule has the DONE action, or when the timeout (in simulation steps) expires.
+The reply to BEHAVIOR is only sent once it finishes: "DONE <rule number> <tick>" or "TIMEOUT <tick>".
+A behaviour still running when the world is reset (World.reset) finishes with TIMEOUT at the first step of the new match.
+E.g. rotating towards a ball (compare algorithm1.StateRotating):
+  BEHAVIOR 3000; NOT CAM -> WHEELS 0 0, DONE; ABS CAM.left < 3 -> WHEELS 0 0, DONE; CAM.left > 0 -> WHEELS 20 -20; ALWAYS -> WHEELS -20 20
+"""
+import thread, traceback
+
+SENSORS = {"CAM": "camera", "BEACON": "beacon", "GOAL": "goal", "OPTO": "optokatkesti"}
+FIELDS = {"dist": 0, "left": 1}
+ACTIONS = ["WHEELS", "GRAB", "SHOOT", "DONE"]
+OPS = {"<": lambda a, b: a < b, ">": lambda a, b: a > b, "<=": lambda a, b: a <= b, ">=": lambda a, b: a >= b}
+
+class BehaviourError(Exception):
+	"Raised for malformed behaviour programs"
+	pass
+
+def parse_term(s):
+	"""
+	Parses a condition term into a tuple, whose first element tells the kind of the term
+	>>> parse_term("ALWAYS")
+	('always',)
+	>>> parse_term("NOT CAM")
+	('seen', 'CAM', True)
+	>>> parse_term("ABS CAM.left < 3")
+	('compare', 'CAM', 1, '<', 3.0, True)
+	>>> parse_term("BEACON.2 >= 0.99")
+	('compare', 'BEACON', 2, '>=', 0.99, False)
+	"""
+	t = s.split()
+	if t == ["ALWAYS"]:
+		return ('always',)
+	if len(t) in [1, 2] and t[-1] in SENSORS and (len(t) == 1 or t[0] == "NOT"):
+		return ('seen', t[-1], len(t) == 2)
+	use_abs = len(t) > 0 and t[0] == "ABS"
+	if use_abs:
+		t = t[1:]
+	if len(t) != 3 or t[1] not in OPS or "." not in t[0]:
+		raise BehaviourError("Cannot parse condition '%s'" % s)
+	sensor, field = t[0].split(".", 1)
+	if sensor not in SENSORS:
+		raise BehaviourError("Unknown sensor '%s'" % sensor)
+	try:
+		field = FIELDS[field] if field in FIELDS else int(field)
+		value = float(t[2])
+	except ValueError:
+		raise BehaviourError("Cannot parse condition '%s'" % s)
+	return ('compare', sensor, field, t[1], value, use_abs)
+
+def parse(program):
+	"""
+	Parses the arguments of a BEHAVIOR command. Returns (timeout, [(list of terms, list of actions)]).
+	>>> parse("100; CAM -> WHEELS 0 0, DONE; ALWAYS -> WHEELS 10 -10")
+	(100, [([('seen', 'CAM', False)], ['WHEELS 0 0', 'DONE']), ([('always',)], ['WHEELS 10 -10'])])
+	>>> parse("10; ALWAYS -> STEP 1")		# The actions run inside the simulation step, they must not wait for it
+	Traceback (most recent call last):
+	...
+	BehaviourError: Action 'STEP 1' is not allowed, use one of WHEELS, GRAB, SHOOT, DONE
+	"""
+	parts = [p.strip() for p in program.split(";")]
+	try:
+		timeout = int(parts[0])
+	except ValueError:
+		raise BehaviourError("Timeout expected, got '%s'" % parts[0])
+	rules = []
+	for p in parts[1:]:
+		if p == "":
+			continue
+		if "->" not in p:
+			raise BehaviourError("Rule '%s' has no '->'" % p)
+		condition, actions = p.split("->", 1)
+		terms = [parse_term(c) for c in condition.split(" AND ")]
+		actions = [a.strip() for a in actions.split(",") if a.strip() != ""]
+		if len(actions) == 0:
+			raise BehaviourError("Rule '%s' has no actions" % p)
+		for a in actions:
+			if a.split()[0] not in ACTIONS:
+				raise BehaviourError("Action '%s' is not allowed, use one of %s" % (a, ", ".join(ACTIONS)))
+		rules.append((terms, actions))
+	if len(rules) == 0:
+		raise BehaviourError("No rules given")
+	return (timeout, rules)
+
+class Behaviour:
+	"""
+	A running behaviour. step() is registered as a world task (see World.tasks), so it runs at the start of every
+	simulation step. execute(cmd) is used to perform the actions, typically RobotServer._process_command.
+	wait() blocks until the behaviour finishes and returns the reply for the client.
+	"""
+	def __init__(self, robot, program, execute):
+		self.robot = robot
+		self.timeout, self.rules = parse(program)
+		for (terms, actions) in self.rules:
+			for t in terms:
+				if t[0] != 'always' and not hasattr(robot, SENSORS[t[1]]):
+					raise BehaviourError("This robot has no %s sensor" % t[1])
+		self.execute = execute
+		self.deadline = robot.world.tick + self.timeout
+		self.match = robot.world.match
+		self.active = None		# Index of the currently active rule
+		self.result = None
+		self.finished = None	# The tick of the step in which the behaviour finished
+		self.done_lock = thread.allocate_lock()
+		self.done_lock.acquire()	# Released when the behaviour finishes
+
+	def wait(self):
+		self.done_lock.acquire()
+		return self.result
+
+	def step(self):
+		"Evaluates the rules once. Returns False when the behaviour has finished."
+		try:
+			return self._step()
+		except:
+			# Never let a behaviour break the simulation
+			traceback.print_exc()
+			return self._finish("ERROR")
+
+	def _step(self):
+		tick = self.robot.world.tick
+		if tick >= self.deadline or self.robot.world.match != self.match:
+			return self._finish("TIMEOUT %d" % tick)
+		readings = {}
+		for (i, (terms, actions)) in enumerate(self.rules):
+			if all([self._holds(t, readings) for t in terms]):
+				if i != self.active:
+					self.active = i
+					for a in actions:
+						if a == "DONE":
+							return self._finish("DONE %d %d" % (i + 1, tick))
+						self.execute(a)
+				return True
+		self.active = None
+		return True
+
+	def _finish(self, result):
+		self.result = result
+		self.finished = self.robot.world.tick
+		self.done_lock.release()
+		return False
+
+	def _holds(self, term, readings):
+		if term[0] == 'always':
+			return True
+		sensor = term[1]
+		if sensor not in readings:
+			# Each sensor is read at most once per step, so all the terms see the same (noisy) reading
+			readings[sensor] = getattr(self.robot, SENSORS[sensor])()
+		v = readings[sensor]
+		if term[0] == 'seen':
+			if isinstance(v, (tuple, list)):
+				seen = tuple(v) != (0, 0)	# GOAL answers 0 0 when the goal is not visible
+			else:
+				seen = bool(v)
+			return seen != term[2]
+		(kind, sensor, field, op, value, use_abs) = term
+		if not isinstance(v, (tuple, list)) or field >= len(v):
+			return False
+		x = abs(v[field]) if use_abs else v[field]
+		return OPS[op](x, value)
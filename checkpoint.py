@@ -0,0 +1,277 @@
+"""
+Checkpoints: the complete state of a match in a compact binary file, to resume an interrupted run
+(main.py --resume) or to start many runs from one shared position.
+
+A checkpoint holds the tick, the match number, the scores, every ball (position, velocity, sleep state), every robot
+(module, pose, wheel speeds, grabbed ball and where it is held, its random generator and its queued actuation commands)
+and the state of the global random generator. The objects keep their order and ids, so a resumed world simulates
+exactly like the original one would have, as long as the controllers send the same commands (in lockstep mode, say).
+Layout (little-endian):
+  8s Q I i i I I I I I  magic "RBTXCKP2", tick, match, score left, score right, width, height, next id,
+                        number of objects, number of random generator state words
+  random generator      I I, words x I, ? d: number of state words, version, state words, whether there is a
+                        gauss_next, gauss_next (the global one without the number of words, it is in the header)
+  then for every object in the world's order, a kind byte and
+    'B': I d d d d ? I           id, x, y, vx, vy, asleep, rest ticks
+    'R': I H name H module d d d d d d i d d
+                                 id, name length, name, module name length, module name, x, y, forward x, forward y,
+                                 left speed, right speed, grabbed ball id (-1 if none), grabbed forward, grabbed left,
+         ? random generator I   whether the robot has a random generator, the generator, noise seed
+         I commands              number of queued actuation commands, each Q I H name B args x d: tick, match,
+                                 name length, name, number of arguments, arguments (see actuation.py)
+Usage:
+  Checkpointer(world, "match-%d.ckp", every=60000).attach()	# Periodically, and on request()
+  save(world, "match.ckp")
+  c = load("match.ckp")
+  world = World(size=c.size); (add the robots); c.restore(world, [robot1, robot2])
+"""
+import os, random, struct
+
+from world import Point, Ball
+
+MAGIC = b"RBTXCKP2"
+HEADER = struct.Struct("<8sQIiiIIIII")
+GAUSS = struct.Struct("<?d")
+KIND = struct.Struct("<c")
+BALL = struct.Struct("<Idddd?I")
+ROBOT_NAME = struct.Struct("<IH")
+LENGTH = struct.Struct("<H")
+ROBOT = struct.Struct("<ddddddidd")
+ROBOT_RANDOM = struct.Struct("<?")
+COUNT = struct.Struct("<I")
+COMMAND = struct.Struct("<QI")
+ARGS = struct.Struct("<B")
+
+def _encode_random(state, with_length=True):
+	version, words, gauss_next = state
+	return "".join([COUNT.pack(len(words)) if with_length else "",
+					struct.pack("<I%dI" % len(words), version, *words),
+					GAUSS.pack(gauss_next is not None, gauss_next or 0)])
+
+def _decode_random(data, pos, nwords=None):
+	"Returns (random generator state, position after it)"
+	if nwords is None:
+		nwords = COUNT.unpack_from(data, pos)[0]
+		pos += COUNT.size
+	rng = struct.unpack_from("<I%dI" % nwords, data, pos)
+	pos += 4*(nwords + 1)
+	has_gauss, gauss_next = GAUSS.unpack_from(data, pos)
+	return ((rng[0], rng[1:], gauss_next if has_gauss else None), pos + GAUSS.size)
+
+def _encode_string(s):
+	return LENGTH.pack(len(s)) + s
+
+def _decode_string(data, pos):
+	"Returns (string, position after it)"
+	length = LENGTH.unpack_from(data, pos)[0]
+	pos += LENGTH.size
+	return (data[pos:pos + length], pos + length)
+
+def _encode_robot(o):
+	g = o.grabbed_ball
+	parts = [ROBOT_NAME.pack(o.id, len(o.name)), o.name, _encode_string(o.__class__.__module__),
+			 ROBOT.pack(o.center.x, o.center.y, o.forward.x, o.forward.y, o.leftSpeed, o.rightSpeed,
+						-1 if g is None else g.id, getattr(o, 'grabbed_forward', 0), getattr(o, 'grabbed_left', 0))]
+	rng = getattr(o, 'random', None)
+	parts.append(ROBOT_RANDOM.pack(rng is not None))
+	if rng is not None:
+		parts += [_encode_random(rng.getstate()), COUNT.pack(o.noise_seed)]
+	queue = getattr(o, 'actuation', None)
+	commands = list(queue.queue) if queue is not None else []	# A copy, the servers may be adding to it
+	parts.append(COUNT.pack(len(commands)))
+	for (tick, match, name, args) in commands:
+		parts += [COMMAND.pack(tick, match), _encode_string(name), ARGS.pack(len(args)), struct.pack("<%dd" % len(args), *args)]
+	return "".join(parts)
+
+def _decode_robot(data, pos):
+	"Returns (robot record, position after it)"
+	id, length = ROBOT_NAME.unpack_from(data, pos)
+	pos += ROBOT_NAME.size
+	name = data[pos:pos + length]
+	module, pos = _decode_string(data, pos + length)
+	state = ROBOT.unpack_from(data, pos)
+	pos += ROBOT.size
+	rng, noise_seed = None, 0
+	if ROBOT_RANDOM.unpack_from(data, pos)[0]:
+		rng, pos = _decode_random(data, pos + ROBOT_RANDOM.size)
+		noise_seed = COUNT.unpack_from(data, pos)[0]
+		pos += COUNT.size
+	else:
+		pos += ROBOT_RANDOM.size
+	n = COUNT.unpack_from(data, pos)[0]
+	pos += COUNT.size
+	commands = []
+	for i in range(n):
+		tick, match = COMMAND.unpack_from(data, pos)
+		name_, pos = _decode_string(data, pos + COMMAND.size)
+		nargs = ARGS.unpack_from(data, pos)[0]
+		args = struct.unpack_from("<%dd" % nargs, data, pos + ARGS.size)
+		pos += ARGS.size + 8*nargs
+		commands.append((tick, match, name_, args))
+	return (('R', id, name, module) + state + (rng, noise_seed, commands), pos)
+
+def encode(world):
+	"""
+	Returns the checkpoint of the world as a string.
+	>>> from world import World
+	>>> from telliskivi import Robot
+	>>> w = World()
+	>>> w.add_object(Ball(Point(300, 300)))
+	>>> r = Robot(w, "A", "TOPLEFT")
+	>>> w.add_object(r)
+	>>> from actuation import queue_of
+	>>> w = World()
+	>>> w.add_object(Ball(Point(300, 300)))
+	>>> r = Robot(w, "A", "TOPLEFT")
+	>>> w.add_object(r)
+	>>> r.wheels(10, 5)
+	>>> for i in range(100):
+	...     w.simulate()
+	>>> w.match = 2
+	>>> q = queue_of(r)
+	>>> q.actions["WHEELS"] = r.wheels
+	>>> q.attach()
+	>>> q.put("WHEELS", 20, 5)
+	101
+	>>> c = decode(encode(w))
+	>>> w2 = World(size=c.size)
+	>>> r2 = Robot(w2, "A", "TOPLEFT")
+	>>> c.restore(w2, [r2])
+	>>> q2 = queue_of(r2)
+	>>> q2.actions["WHEELS"] = r2.wheels
+	>>> q2.attach()
+	>>> for i in range(100):
+	...     w.simulate(); w2.simulate()
+	>>> (w2.tick, w2.match, (r2.center.x, r2.center.y) == (r.center.x, r.center.y), [o.id for o in w2.objects])
+	(200, 2, True, [0, 1])
+	>>> (r2.leftSpeed, r2.rightSpeed) == (r.leftSpeed, r.rightSpeed) and r2.random.random() == r.random.random()
+	True
+	>>> import spirit
+	>>> c.restore(World(size=c.size), [spirit.Robot(w2, "A", "TOPLEFT")])
+	Traceback (most recent call last):
+	ValueError: The checkpoint's robot A is a telliskivi robot, not spirit
+	"""
+	version, words, gauss_next = random.getstate()
+	objects = []
+	for o in world.objects:
+		if isinstance(o, Ball):
+			objects.append(KIND.pack('B') + BALL.pack(o.id, o.center.x, o.center.y, o.v.x, o.v.y, o.asleep, o.rest_ticks))
+		else:
+			objects.append(KIND.pack('R') + _encode_robot(o))
+	return "".join([HEADER.pack(MAGIC, world.tick, world.match, world.scoreLeft, world.scoreRight, world.width, world.height,
+								world.next_id, len(objects), len(words)),
+					_encode_random((version, words, gauss_next), with_length=False)] + objects)
+
+def decode(data):
+	"Parses a checkpoint string into a Checkpoint"
+	magic, tick, match, left, right, width, height, next_id, n, nwords = HEADER.unpack_from(data, 0)
+	if magic != MAGIC:
+		raise ValueError("Not a checkpoint (or one of an older version)")
+	c = Checkpoint()
+	c.tick, c.match, c.scores, c.size, c.next_id = tick, match, (left, right), (width, height), next_id
+	c.random_state, pos = _decode_random(data, HEADER.size, nwords)
+	for i in range(n):
+		kind = KIND.unpack_from(data, pos)[0]
+		pos += KIND.size
+		if kind == 'B':
+			c.objects.append(('B',) + BALL.unpack_from(data, pos))
+			pos += BALL.size
+		else:
+			robot, pos = _decode_robot(data, pos)
+			c.objects.append(robot)
+	return c
+
+def save(world, path):
+	"Writes the checkpoint of the world into a file. The file is replaced atomically, so it is never half-written."
+	f = open(path + ".tmp", "wb")
+	f.write(encode(world))
+	f.close()
+	os.rename(path + ".tmp", path)
+
+def load(path):
+	f = open(path, "rb")
+	try:
+		return decode(f.read())
+	finally:
+		f.close()
+
+class Checkpoint:
+	"A parsed checkpoint: tick, match, scores, size, next_id, random_state and the object records"
+	def __init__(self):
+		self.objects = []
+
+	def restore(self, world, robots):
+		"""
+		Puts the state into a world with no objects in it. The robots, created by their modules as usual,
+		are matched to the checkpoint by name and added to the world in the saved order. A robot of another module than
+		the saved one is refused with a ValueError. The queued actuation commands go to the robots' queues (see
+		actuation.queue_of), to be applied once their servers are started.
+		The random generator is restored last, so anything random done before (creating the robots) does not matter.
+		"""
+		from actuation import queue_of
+		by_name = dict((r.name, r) for r in robots)
+		for o in self.objects:
+			if o[0] == 'R' and o[2] in by_name and by_name[o[2]].__class__.__module__ != o[3]:
+				raise ValueError("The checkpoint's robot %s is a %s robot, not %s" % (o[2], o[3], by_name[o[2]].__class__.__module__))
+		balls = {}
+		world.objects = []
+		for o in self.objects:
+			if o[0] == 'B':
+				id, x, y, vx, vy, asleep, rest_ticks = o[1:]
+				b = Ball(Point(x, y))
+				b.v = Point(vx, vy)
+				b.asleep, b.rest_ticks = asleep, rest_ticks
+				balls[id] = b
+				world.objects.append(b)
+			else:
+				(id, name, module, x, y, fx, fy, left_speed, right_speed, grabbed, grabbed_forward, grabbed_left,
+				 rng, noise_seed, commands) = o[1:]
+				b = by_name[name]
+				b.center, b.forward, b.left = Point(x, y), Point(fx, fy), Point(-fy, fx)
+				b.leftSpeed, b.rightSpeed = left_speed, right_speed
+				b.grabbed_ball = grabbed
+				b.grabbed_forward, b.grabbed_left = grabbed_forward, grabbed_left
+				if rng is not None:
+					b.random.setstate(rng)
+					b.noise_seed = noise_seed
+				queue = queue_of(b)
+				queue.queue.clear()
+				queue.queue.extend(commands)
+				world.objects.append(b)
+			world.objects[-1].id = id
+		for o in world.objects:
+			if not isinstance(o, Ball):
+				o.grabbed_ball = balls[o.grabbed_ball] if o.grabbed_ball >= 0 else None
+		world.tick, world.match = self.tick, self.match
+		world.scoreLeft, world.scoreRight = self.scores
+		world.next_id = self.next_id
+		world.sensor_cache = (-1, {})
+		random.setstate(self.random_state)
+
+class Checkpointer:
+	"""
+	Writes checkpoints every `every` simulation steps (0 = never) and on request(), e.g. from a signal handler.
+	It runs as a world task, so the checkpoints are always taken between two steps. If the path contains %d,
+	it is replaced by the tick (keeping all the checkpoints), otherwise the file holds the latest one.
+	"""
+	def __init__(self, world, path, every=0):
+		self.world = world
+		self.path = path
+		self.every = every
+		self.requested = False
+
+	def attach(self):
+		self.world.tasks.append(self.check)
+
+	def request(self):
+		"Asks for a checkpoint before the next step. Safe to call from any thread or a signal handler."
+		self.requested = True
+
+	def check(self):
+		tick = self.world.tick
+		if self.requested or (self.every > 0 and tick > 0 and tick % self.every == 0):
+			self.requested = False
+			path = self.path % tick if "%" in self.path else self.path
+			save(self.world, path)
+			print "Checkpoint at tick %d written to %s" % (tick, path)
+		return True		# Keep running as a world task
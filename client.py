@@ -0,0 +1,216 @@
+"""
+Client library for the RobotServer protocol. Controllers should use this instead of raw sockets.
+
+Commands are sent as "\\n"-terminated lines and replies are read with a line-buffered reader,
+so several commands may be in flight at once (pipelining). Nagle's algorithm is disabled
+and every request is timed, see RobotClient.stats.
+Usage:
+  c = RobotClient(5000)
+  c.wheels(20, 20)
+  ball = c.cam()                      # (distance, left) or None
+  replies = c.batch(["CAM", "BEACON"]) # Both requests are sent in one packet
+  print c.stats.report()
+"""
+import socket, time
+
+class CommandError(Exception):
+	"Raised when the server replies with an ERROR to a command"
+	pass
+
+class LatencyStats:
+	"""
+	Per-command latency histograms. Latencies are counted in power-of-two buckets of microseconds
+	(bucket k holds latencies in [2^(k-1), 2^k) us), which keeps recording cheap and memory constant.
+	>>> s = LatencyStats()
+	>>> for t in [0.0001, 0.0001, 0.0002, 0.004]:
+	...     s.record("CAM", t)
+	>>> s.count("CAM")
+	4
+	>>> s.percentile("CAM", 50)		# Upper bound of the bucket, in seconds
+	0.000128
+	>>> s.percentile("CAM", 100)
+	0.004096
+	"""
+	def __init__(self):
+		self.histograms = {}	# command -> [count, total seconds, max seconds, bucket list]
+
+	def record(self, cmd, seconds):
+		h = self.histograms.get(cmd)
+		if h is None:
+			h = self.histograms[cmd] = [0, 0.0, 0.0, [0]*32]
+		h[0] += 1
+		h[1] += seconds
+		if seconds > h[2]:
+			h[2] = seconds
+		us = min(int(seconds*1000000), 2**31 - 1)
+		h[3][len(bin(us)) - 2 if us > 0 else 0] += 1
+
+	def count(self, cmd):
+		h = self.histograms.get(cmd)
+		return h[0] if h is not None else 0
+
+	def mean(self, cmd):
+		h = self.histograms[cmd]
+		return h[1]/h[0]
+
+	def percentile(self, cmd, p):
+		"Returns an upper bound (in seconds) for the p-th percentile latency of the command"
+		h = self.histograms[cmd]
+		needed = h[0]*p/100.0
+		seen = 0
+		for (k, n) in enumerate(h[3]):
+			seen += n
+			if n > 0 and seen >= needed:
+				return (2**k)/1000000.0
+		return h[2]
+
+	def report(self):
+		"Returns a human-readable table of latencies (in milliseconds)"
+		lines = ["%-8s %8s %8s %8s %8s %8s" % ("command", "count", "mean", "p50", "p99", "max")]
+		for cmd in sorted(self.histograms.keys()):
+			h = self.histograms[cmd]
+			lines.append("%-8s %8d %8.3f %8.3f %8.3f %8.3f" % (cmd, h[0], self.mean(cmd)*1000,
+							self.percentile(cmd, 50)*1000, self.percentile(cmd, 99)*1000, h[2]*1000))
+		return "\n".join(lines)
+
+class RobotClient:
+	"""
+	A connection to a RobotServer.
+	  command(cmd)   - send a command and wait for its reply (a string, without the newline)
+	  send(cmd)      - send a command without waiting; its reply must later be fetched with reply()
+	  batch(cmds)    - send several commands in one go and return their replies
+	The typed accessors (wheels, cam, beacon, goal, opto, grab, shoot) raise CommandError on ERROR replies.
+	"""
+	def __init__(self, port, host='localhost', timeout=5.0):
+		self.socket = socket.create_connection((host, port), timeout)
+		self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+		self.buffer = ""
+		self.pending = []	# (command name, send time) of requests whose reply has not been read yet
+		self.stats = LatencyStats()
+
+	def close(self):
+		self.socket.close()
+
+	# ----------- Raw protocol -----------------
+
+	def send(self, cmd):
+		self._send([cmd])
+
+	def reply(self):
+		"Reads the reply to the oldest pending request"
+		line = self._readline()
+		name, started = self.pending.pop(0)
+		self.stats.record(name, time.time() - started)
+		return line
+
+	def command(self, cmd):
+		self.send(cmd)
+		return self.reply()
+
+	def batch(self, cmds):
+		self._send(cmds)
+		return [self.reply() for c in cmds]
+
+	def _send(self, cmds):
+		now = time.time()
+		for c in cmds:
+			parts = c.split()
+			self.pending.append((parts[0] if parts else "", now))
+		self.socket.sendall("".join([c.rstrip("\n") + "\n" for c in cmds]))
+
+	def _readline(self):
+		while "\n" not in self.buffer:
+			data = self.socket.recv(4096)
+			if not data:
+				raise socket.error("Connection closed by the server")
+			self.buffer += data
+		line, self.buffer = self.buffer.split("\n", 1)
+		return line
+
+	# ----------- Typed accessors -----------------
+
+	def _checked(self, cmd):
+		r = self.command(cmd)
+		if r.startswith("ERROR"):
+			raise CommandError("%s: %s" % (cmd, r))
+		return r
+
+	def wheels(self, left, right):
+		"Sets the wheel speeds, returns the simulation tick at which they take effect (see actuation.py)"
+		return int(self._checked("WHEELS %d %d" % (left, right)))
+
+	def grab(self):
+		"Returns the simulation tick at which the grab takes effect"
+		return int(self._checked("GRAB"))
+
+	def shoot(self):
+		"Returns the simulation tick at which the shot takes effect"
+		return int(self._checked("SHOOT"))
+
+	def cam(self):
+		"Returns (distance, left) to the ball seen by the camera, or None if no ball is seen"
+		dist, left = map(float, self._checked("CAM").split())
+		if (dist, left) in [(-1, -1), (0, 0)]:
+			return None
+		return (dist, left)
+
+	def cam_all(self):
+		"Returns [(distance, left)] to all the balls seen by the camera (CAM ALL), nearest first"
+		v = map(float, self._checked("CAM ALL").split()[1:])
+		return zip(v[0::2], v[1::2])
+
+	def beacon(self):
+		"""
+		Returns the parsed BEACON reply. Depending on the robot this is either a bool
+		(whether the robot faces the beacon) or a tuple of floats (beacon offsets in robot coordinates).
+		"""
+		v = self._checked("BEACON").split()
+		if len(v) == 1:
+			return v[0] == "1"
+		return tuple(map(float, v))
+
+	def goal(self):
+		"Returns (distance, left) to the opponent's goal, or None if it is not visible"
+		dist, left = map(float, self._checked("GOAL").split())
+		if (dist, left) == (0, 0):
+			return None
+		return (dist, left)
+
+	def behaviour(self, program):
+		"""
+		Runs a server-side behaviour (see behaviours.py) and waits until it finishes,
+		however long it takes. Returns the reply, e.g. "DONE 2 1234" or "TIMEOUT 5000".
+		"""
+		return self._untimed("BEHAVIOR " + program)
+
+	def step(self, n=1):
+		"""
+		Lets the simulation run n steps (ms) and returns the simulation tick once it has.
+		In lockstep mode (see lockstep.py) this also tells the simulator that the commands for now are sent.
+		"""
+		return int(self._untimed("STEP %d" % n))
+
+	def tick(self):
+		"Returns the simulation tick, i.e. the simulated time in milliseconds"
+		return int(self._checked("TICK"))
+
+	def reset(self, seed=None):
+		"Asks the simulator to start a new match (with the given random seed) before its next step"
+		self._checked("RESET" if seed is None else "RESET %d" % seed)
+
+	def match(self):
+		"Returns the number of the match, it changes when the simulator is reset (by any controller or from the window)"
+		return int(self._checked("MATCH"))
+
+	def _untimed(self, cmd):
+		"Sends a command whose reply may take arbitrarily long, without the socket timeout"
+		timeout = self.socket.gettimeout()
+		self.socket.settimeout(None)
+		try:
+			return self._checked(cmd)
+		finally:
+			self.socket.settimeout(timeout)
+
+	def opto(self):
+		"Returns True if there is a ball in the grabber"
+		return self._checked("OPTO") == "1"
@@ -0,0 +1,124 @@
+"""
+Match event log.
+
+Events (goals, grabs, shots, wall and robot collisions, received commands, resets) are buffered in memory column by column
+and flushed in batches, so a match produces one columnar file which can be bulk-loaded for analysis
+(e.g. numpy.genfromtxt / pandas.read_csv, or numpy.load for the .npz chunks). The matches started by
+World.reset go into files of their own, see EventLog.new_match. A contact is logged when it starts
+(wall and collision), not on every step it lasts, see World._contact_starts.
+Columns:
+  tick   - simulation step of the event
+  event  - goal, grab, shoot, wall, collision, command or reset (the first row of the file of a new match)
+  robot  - name of the robot involved (empty if none)
+  ball   - id of the ball involved (-1 if none), see World.add_object
+  x, y   - position of the ball (or the robot, if no ball is involved)
+  name   - goal: LEFT/RIGHT, wall: index into World.walls, collision: the other robot's name or ball's id,
+           command: the command, reset: the random seed (empty if none)
+  args   - command arguments
+  reply  - reply to the command
+"""
+import thread, csv
+
+COLUMNS = ["tick", "event", "robot", "ball", "x", "y", "name", "args", "reply"]
+
+class EventLog:
+	"""
+	Usage:
+	  world.events = EventLog("match-001")			# Writes match-001.csv
+	  world.events = EventLog("match-001", "npz")	# Writes match-001-00000.npz, match-001-00001.npz, ... (requires numpy)
+	  world.events.new_match(1)						# From here on writes match-001-match1.csv (done by World.reset)
+	  ...
+	  world.events.close()
+	The world, the robots and the servers log through World.log_event.
+	"""
+	def __init__(self, prefix, format="csv", batch=10000):
+		if format not in ["csv", "npz"]:
+			raise ValueError("Unknown event log format %s" % format)
+		self.base = prefix
+		self.format = format
+		self.batch = batch
+		self.columns = dict([(c, []) for c in COLUMNS])
+		self.rows = 0
+		self.lock = thread.allocate_lock()	# Events come from the main thread and the server threads
+		self._open(prefix)
+
+	def new_match(self, match):
+		"Writes the rest of the current match and continues the log in a file of its own for match number match"
+		with self.lock:
+			self._flush()
+			if self.format == "csv":
+				self.file.close()
+			self._open("%s-match%d" % (self.base, match))
+
+	def log(self, tick, event, robot=None, ball=None, name="", args="", reply=""):
+		o = ball if ball is not None else robot
+		with self.lock:
+			c = self.columns
+			c["tick"].append(tick)
+			c["event"].append(event)
+			c["robot"].append(robot.name if robot is not None else "")
+			c["ball"].append(getattr(ball, 'id', -1) if ball is not None else -1)
+			c["x"].append(o.center.x if o is not None else 0.0)
+			c["y"].append(o.center.y if o is not None else 0.0)
+			c["name"].append(name)
+			c["args"].append(args)
+			c["reply"].append(reply)
+			self.rows += 1
+			if self.rows >= self.batch:
+				self._flush(keep_last=True)
+
+	def flush(self):
+		with self.lock:
+			self._flush()
+
+	def close(self):
+		self.flush()
+		if self.format == "csv":
+			self.file.close()
+
+	def _open(self, prefix):
+		self.prefix = prefix
+		self.chunks = 0
+		if self.format == "csv":
+			self.file = open(prefix + ".csv", "wb")
+			self.writer = csv.writer(self.file)
+			self.writer.writerow(COLUMNS)
+
+	def _flush(self, keep_last=False):
+		"""
+		Writes the buffered rows, ordered by (tick, robot). The robot servers and the simulation log concurrently, so the
+		rows of a tick arrive in varying order, but each robot's in the same one, hence a lockstep match gives the same
+		file every time. With keep_last, the rows of the last tick (which may get more rows) are kept for the next flush.
+		>>> from world import Point
+		>>> class R:
+		...     name, center = "B", Point(0, 0)
+		>>> log = EventLog("/tmp/events-doctest", batch=3)
+		>>> log.log(1, "command", R(), name="CAM"); log.log(1, "goal", name="LEFT"); log.log(2, "reset")
+		>>> log.close()
+		>>> [l.split(",")[:3] for l in open("/tmp/events-doctest.csv").read().split()]
+		[['tick', 'event', 'robot'], ['1', 'goal', ''], ['1', 'command', 'B'], ['2', 'reset', '']]
+		"""
+		if self.rows == 0:
+			return
+		c = self.columns
+		ticks, robots = c["tick"], c["robot"]
+		order = sorted(range(self.rows), key=lambda i: (ticks[i], robots[i]))	# Stable, a robot's rows keep their order
+		kept = []
+		if keep_last and ticks[order[0]] != ticks[order[-1]]:
+			last = ticks[order[-1]]
+			kept = [i for i in order if ticks[i] == last]
+			order = order[:len(order) - len(kept)]
+		rest = dict([(k, [c[k][i] for i in kept]) for k in COLUMNS])
+		c = dict([(k, [c[k][i] for i in order]) for k in COLUMNS])
+		if self.format == "csv":
+			self.writer.writerows(zip(*[c[k] for k in COLUMNS]))
+			self.file.flush()
+		else:
+			import numpy
+			arrays = {}
+			for k in COLUMNS:
+				arrays[k] = numpy.array(c[k])
+			numpy.savez("%s-%05d.npz" % (self.prefix, self.chunks), **arrays)
+		self.chunks += 1
+		self.columns = rest
+		self.rows = len(kept)
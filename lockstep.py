@@ -0,0 +1,106 @@
+"""
+Lockstep stepping of the simulation with the controllers.
+
+Normally the simulation runs in real time and the controllers run freely against it, so the outcome of a match
+depends on the OS scheduling. In lockstep mode (main.py --lockstep N) the world only advances as far as every
+controller has allowed it to, hence a match runs as fast as its slowest controller and does not depend on timing.
+A controller takes part by sending
+  STEP <n>  - "my commands for now are sent, simulate n more steps (ms)". The reply is the simulation tick,
+              sent when the world has got there. All the other commands are handled while the world stands still.
+  TICK      - replies the current simulation tick, i.e. the simulated time in ms (works in normal mode, too).
+A controller joins the lockstep with its first STEP and leaves when it disconnects. Controllers which never send
+STEP are not waited for. While a BEHAVIOR runs, its controller does not hold the world back; when it finishes,
+the world is held after that step, and the reply is sent from there.
+If a controller has not sent its STEP within the timeout (wall clock seconds), the world moves on by one period
+without it, so a hung controller cannot stall the match.
+The wheel and sensor noise is drawn in the simulation thread from each robot's own random generator, which is
+seeded with the match seed (see telliskivi.Robot.noise), so with the same seed and controllers that seed their own
+random decisions (algorithm1.py takes a seed argument) a lockstep match can be repeated exactly.
+"""
+import threading, thread, time
+
+class Lockstep:
+	"""
+	The barrier between the simulation loop and the robot servers. It is attached as world.lockstep.
+	  controllers - the simulation does not start before this many controllers have joined
+	  timeout     - seconds to wait for a late controller before moving on without it
+	  period      - number of steps the world moves on by when a controller is late
+	Usage (simulation loop):
+	  while 1:
+	    lockstep.wait()		# Blocks until every controller allows the next step
+	    world.simulate()
+	"""
+	def __init__(self, world, controllers=2, timeout=1.0, period=20):
+		self.world = world
+		self.controllers = controllers
+		self.timeout = timeout
+		self.period = period
+		self.started = False
+		self.targets = {}	# controller -> the tick up to which it allows the world to run (None = no limit)
+		self.cond = threading.Condition()
+		self.blocked = None		# (tick, time) while the simulation waits at a barrier
+		self.watchdog = None
+
+	def step(self, controller, n):
+		"Allows the world to run n more steps and waits until it has. Returns the tick. Called by the robot servers."
+		with self.cond:
+			return self.reach(controller, self.world.tick + n)
+
+	def reach(self, controller, target):
+		"Allows the world to run up to the tick target and waits until it has got there. Returns the tick."
+		with self.cond:
+			self.targets[controller] = target
+			self.cond.notify_all()
+			while self.world.tick < target:
+				self.cond.wait()
+			return self.world.tick
+
+	def allow(self, controller, target):
+		"Sets the tick up to which the controller allows the world to run (None = no limit) without waiting"
+		with self.cond:
+			self.targets[controller] = target
+			self.cond.notify_all()
+
+	def leave(self, controller):
+		with self.cond:
+			if controller in self.targets:
+				del self.targets[controller]
+				self.cond.notify_all()
+
+	def limit(self):
+		"The tick up to which the world may run, or None if it is not limited"
+		limits = [t for t in self.targets.values() if t is not None]
+		return min(limits) if len(limits) > 0 else None
+
+	def wait(self):
+		"Blocks until the world may do its next step. Called by the simulation loop before World.simulate."
+		with self.cond:
+			while not self.started:
+				self.started = len(self.targets) >= self.controllers
+				if not self.started:
+					self.cond.wait()
+			limit = self.limit()
+			if limit is None or self.world.tick < limit:
+				return
+			# A barrier: wake up the controllers waiting for this tick and wait for their next STEP.
+			# NB: timed waits are polling in Python 2, hence the timeout is left to the watchdog thread.
+			if self.watchdog is None:
+				self.watchdog = thread.start_new_thread(self._watchdog, ())
+			self.cond.notify_all()
+			self.blocked = (self.world.tick, time.time())
+			while limit is not None and self.world.tick >= limit:
+				self.cond.wait()
+				limit = self.limit()
+			self.blocked = None
+
+	def _watchdog(self):
+		"Moves the world on without the late controllers when it has been waiting for longer than the timeout"
+		while 1:
+			time.sleep(self.timeout/4)
+			with self.cond:
+				if self.blocked is None or time.time() - self.blocked[1] < self.timeout:
+					continue
+				for (c, t) in self.targets.items():
+					if t is not None and t <= self.world.tick:
+						self.targets[c] = self.world.tick + self.period
+				self.cond.notify_all()
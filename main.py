@@ -1,95 +1,324 @@
-import pygame,sys,random
-from pygame.locals import *
-from pygame.time import get_ticks
+import sys,random,time
+from optparse import OptionParser
 
 from world import Point, World, Ball
-from robot import Robot, RobotServer
 
 # ---------------- Main program logic ----------------
-def input(events): 
-	for event in events: 
-		if event.type == QUIT: 
-			sys.exit(0) 
+def input(events, world):
+	from pygame.locals import QUIT, KEYDOWN, K_ESCAPE, K_r
+	for event in events:
+		if event.type == QUIT:
+			sys.exit(0)
 		elif event.type == KEYDOWN:
 			if event.key == K_ESCAPE:
 				sys.exit(0)
-		else: 
+			elif event.key == K_r and world.can_reset():
+				world.request_reset()	# A new match with a random seed
+		else:
 			pass #print event
 
+def parse_size(s):
+	"Parses a WIDTHxHEIGHT string"
+	w, h = s.lower().split('x')
+	return (int(w), int(h))
+
+def random_balls(width, height, count):
+	"Returns the (x, y) of count balls placed at random (coordinates are world-coords)"
+	# Make sure the balls are added symmetrically. That means the first ball goes in the center if the count is odd
+	balls = [(width/2, height/2)] if count % 2 == 1 else []
+	for i in range(count/2):
+		while True:
+			xpos = random.uniform(10,width-10)
+			ypos = random.uniform(10,height-10)
+			# Make sure the positions do not get in the robot's starting corners ( 0..60px, i.e. 0..60px )
+			if not ((xpos < 60 and ypos < 60) or (xpos > width - 60 and ypos > height - 60)):
+				break
+		balls += [(xpos, ypos), (width-xpos, height-ypos)]
+	return balls
+
 def main():
 	# Read two parameters identifying modules for the first and the second robots.
-	if (len(sys.argv) < 3):
-		print "Usage: python main.py <first_robot> <second_robot> [random seed]"
+	parser = OptionParser(usage="python main.py [options] <first_robot> <second_robot> [random seed]")
+	parser.add_option("--headless", action="store_true", default=False,
+					  help="Run without a window and without real-time pacing")
+	parser.add_option("--render-process", action="store_true", default=False,
+					  help="Draw the window in a separate process, so that drawing never delays the simulation")
+	parser.add_option("--render-share", type="float", default=0.25, metavar="FRACTION",
+					  help="Share of the CPU time the window may use for drawing, frames are skipped beyond it and "
+						   "whenever the simulation falls behind (default: 0.25)")
+	parser.add_option("--tick-tolerance", type="float", default=2, metavar="MS",
+						   help="In real time, how late a simulation step may be. Between the steps due the simulator sleeps, "
+						   "waking up about 1000/MS times a second (default: 2)")
+	parser.add_option("--field", metavar="WxH", help="Size of the field in pixels, 1 pixel = 5mm (default: 900x600)")
+	parser.add_option("--balls", type="int", default=11, help="Number of balls (default: 11)")
+	parser.add_option("--distribution", metavar="NAME",
+						   help="Place the balls with the scenario generator: uniform, clustered or near-goal (see scenario.py)")
+	parser.add_option("--scenario", metavar="PATH",
+						   help="Load the field size and the balls from a scenario file (see scenario.py)")
+	parser.add_option("--workers", type="int", default=0, metavar="N",
+					  help="Simulate the balls in N worker processes, for huge fields and numbers of balls (requires numpy, see parallel.py)")
+	parser.add_option("--ticks", type="int", default=0,
+					  help="Stop after this many simulation steps, 1 step = 1ms (default: run forever)")
+	parser.add_option("--record", metavar="PATTERN",
+					  help="Record frames to an image sequence, e.g. frames/%05d.png")
+	parser.add_option("--record-cmd", metavar="COMMAND",
+					  help="Record frames as raw RGB24 video piped to COMMAND, e.g. "
+						   "\"ffmpeg -f rawvideo -pix_fmt rgb24 -s %(width)dx%(height)d -r %(fps)f -i - match.mp4\"")
+	parser.add_option("--record-every", type="int", default=40, metavar="STEPS",
+					  help="Record a frame every STEPS simulation steps (default: 40, i.e. 25 fps)")
+	parser.add_option("--record-size", metavar="WxH", help="Resolution of the recorded frames (default: 1060x760)")
+	parser.add_option("--metrics-port", type="int", metavar="PORT",
+					  help="Serve simulator health metrics over HTTP at this port")
+	parser.add_option("--shm", metavar="PATH",
+					  help="Publish the world state into a shared memory file on every step, e.g. /dev/shm/robotex (see shm.py)")
+	parser.add_option("--events", metavar="PREFIX",
+					  help="Log the match events (goals, grabs, shots, collisions, commands) into PREFIX.csv, and those of the "
+						   "matches started by a reset into PREFIX-match1.csv, ... (see events.py)")
+	parser.add_option("--events-format", default="csv", metavar="FORMAT",
+					  help="Format of the event log: csv (one file per match) or npz (PREFIX-00000.npz, ..., requires numpy)")
+	parser.add_option("--spectator-port", type="int", metavar="PORT",
+					  help="Broadcast compact world state frames to any number of spectators at this port (see spectator.py)")
+	parser.add_option("--spectator-every", type="int", default=40, metavar="STEPS",
+					  help="Broadcast a spectator frame every STEPS simulation steps (default: 40, i.e. 25 fps)")
+	parser.add_option("--occlusion", action="store_true", default=False,
+					  help="Balls and robots hide the balls behind them from the camera (see occlusion.py)")
+	parser.add_option("--sensor-engine", action="store_true", default=False,
+					  help="Compute the sensor readings of both robots in one vectorized pass per step (needs numpy, see sensors.py; "
+						   "default: off, each robot scans the objects itself; always on with --workers)")
+	parser.add_option("--checkpoint", metavar="PATH",
+					  help="Write checkpoints to PATH (%d is replaced by the tick) every --checkpoint-every steps and "
+						   "whenever the simulator gets SIGUSR1 (see checkpoint.py)")
+	parser.add_option("--checkpoint-every", type="int", default=0, metavar="STEPS",
+					  help="Write a checkpoint every STEPS simulation steps (default: only on SIGUSR1)")
+	parser.add_option("--resume", metavar="PATH",
+					  help="Resume the match from a checkpoint (the field and the balls come from the checkpoint)")
+	parser.add_option("--lockstep", type="int", default=0, metavar="N",
+					  help="Step the simulation in lockstep with N controllers using the STEP command, as fast as they allow "
+							   "(implies --headless, see lockstep.py)")
+	parser.add_option("--lockstep-timeout", type="float", default=1.0, metavar="SECONDS",
+					  help="In lockstep, how long to wait for a late controller before moving on without it (default: 1)")
+	(options, args) = parser.parse_args()
+	if options.workers and (options.checkpoint or options.resume):
+		parser.error("checkpoints are not supported with --workers")
+	if (len(args) < 2):
+		print "Usage: python main.py [options] <first_robot> <second_robot> [random seed]"
 		print ""
 		print "The <first_robot> and <second_robot> should identify modules containing classes Robot and RobotServer"
 		print "E.g if you invoke "
 		print "  python main.py telliskivi ekrs"
 		print "The simulator will import telliskivi.Robot, telliskivi.RobotServer, ekrs.Robot, ekrs.RobotServer"
+		print "Run with --help to see the options"
 		sys.exit(1)
-	
+
 	# Try to import modules
-	r1module = __import__(sys.argv[1])
-	r2module = __import__(sys.argv[2])
+	r1module = __import__(args[0])
+	r2module = __import__(args[1])
 	(a,b,c,d) = (r1module.Robot, r1module.RobotServer, r2module.Robot, r2module.RobotServer) # Testing
-	random_seed = int(sys.argv[3]) if len(sys.argv) > 3 else None
+	random_seed = int(args[2]) if len(args) > 2 else None
 	# random seeds 1,2,3,4 are already interesting use cases
-	
-	# Init graphics
-	pygame.init()
-	window = pygame.display.set_mode((1060, 760)) # This is the size of the field + contestant area. (5300 x 3800)
-	pygame.display.set_caption('Robotex 2011 Simulator') 
-	screen = pygame.display.get_surface() 
 
-	# Init world. 
-	world = World(screen)
+	# Init world.
+	size = parse_size(options.field) if options.field else (900, 600)
+	balls = None
+	if options.scenario:
+		import scenario
+		size, balls = scenario.load(options.scenario)
+	resume = None
+	if options.resume:
+		from checkpoint import load
+		resume = load(options.resume)
+		size = resume.size
+	if options.workers:
+		from parallel import StripWorld
+		world = StripWorld(size, options.workers)
+	else:
+		world = World(options.sensor_engine, size)
+
+	# The balls of a match, also for the matches started by RESET (see World.reset)
+	def new_match(seed):
+		if balls is not None:
+			return balls
+		elif options.distribution:
+			import scenario
+			return scenario.generate(world.width, world.height, options.balls, options.distribution, seed=seed)
+		else:
+			return random_balls(world.width, world.height, options.balls)
+	world.new_match = new_match
+
+	# Add the balls, unless resuming (the checkpoint has them)
+	if resume is None:
+		random.seed(random_seed)
+		for (x, y) in new_match(random_seed):
+			world.add_object(Ball(Point(x, y)))
 
-	# Add 11 balls (coordinates are world-coords)
-	# Make sure the balls are added symmetrically. That means the first ball goes in the center
-	world.add_object(Ball(Point(world.width/2, world.height/2)))	
-	for i in range(5):
-		while True:
-			xpos = random.uniform(10,world.width-10)
-			ypos = random.uniform(10,world.height-10)
-			# Make sure the positions do not get in the robot's starting corners ( 0..60px, i.e. 0..60px )
-			if not ((xpos < 60 and ypos < 60) or (xpos > world.width - 60 and ypos > world.height - 60)):
-				break
-		world.add_object(Ball(Point(xpos, ypos)))
-		world.add_object(Ball(Point(world.width-xpos, world.height-ypos)))
-	
 	# Create two robots
 	robot1 = r1module.Robot(world, "Robot A", "TOPLEFT")
 	robot2 = r2module.Robot(world, "Robot B", "BOTTOMRIGHT")
 	world.add_object(robot1)
 	world.add_object(robot2)
-	
+	if resume is not None:
+		try:
+			resume.restore(world, [robot1, robot2])
+		except ValueError, e:
+			parser.error(str(e))	# The robots on the command line are not those of the checkpoint
+		print "Resuming from tick %d, score %d - %d" % (world.tick, world.scoreLeft, world.scoreRight)
+	robot1.camera_occlusion = robot2.camera_occlusion = options.occlusion
+
+	# Start the render process before the servers, so that it does not inherit their sockets
+	render_process = None
+	if options.render_process and not options.headless:
+		from renderproc import RenderProcess, pose
+		render_process = RenderProcess([(args[0], robot1.name, "TOPLEFT", pose(robot1)), (args[1], robot2.name, "BOTTOMRIGHT", pose(robot2))],
+									   (world.width, world.height))
+
+	# Metrics must be attached before the servers start, the servers report to world.metrics
+	if options.metrics_port:
+		from metrics import Metrics, MetricsServer
+		world.metrics = Metrics()
+		MetricsServer(world.metrics, options.metrics_port).serve()
+
+	if options.shm:
+		from shm import StatePublisher
+		StatePublisher(world, options.shm).attach()
+
+	if options.spectator_port:
+		from spectator import SpectatorServer
+		SpectatorServer(world, options.spectator_port, options.spectator_every).serve()
+
+	# The event log and the lockstep, too, must be there before the servers start
+	if options.events:
+		from events import EventLog
+		world.events = EventLog(options.events, options.events_format)
+
+	if options.lockstep:
+		from lockstep import Lockstep
+		world.lockstep = Lockstep(world, options.lockstep, options.lockstep_timeout)
+
+	if options.checkpoint:
+		from checkpoint import Checkpointer
+		checkpointer = Checkpointer(world, options.checkpoint, options.checkpoint_every)
+		checkpointer.attach()
+		import signal
+		if hasattr(signal, "SIGUSR1"):
+			signal.signal(signal.SIGUSR1, lambda signum, frame: checkpointer.request())
+
 	# Start robot command servers
 	r1module.RobotServer(robot1, 5000).serve()
 	r2module.RobotServer(robot2, 5001).serve()
-	
-	# Do the simulation/drawing/event cycle
-	last_sim = -1000
+
+	# Offscreen recording
+	recorder = None
+	if options.record or options.record_cmd:
+		from render import FrameRecorder
+		size = parse_size(options.record_size) if options.record_size else None
+		recorder = FrameRecorder(world, pattern=options.record, command=options.record_cmd,
+								 every=options.record_every, size=size)
+
+	try:
+		if world.lockstep is not None:
+			run_lockstep(world, options.ticks, recorder)
+		elif options.headless:
+			run_headless(world, options.ticks, recorder)
+		elif render_process is not None:
+			run_render_process(world, options.ticks, recorder, render_process, options.tick_tolerance)
+		else:
+			run_gui(world, options.ticks, recorder, options.render_share, options.tick_tolerance)
+	finally:
+		# Also on sys.exit from the window, so that the recording and the event log are complete
+		if recorder is not None:
+			recorder.close()
+		if world.events is not None:
+			world.events.close()
+		if options.workers:
+			world.close()
+	print "Final score: %d - %d" % (world.scoreLeft, world.scoreRight)
+
+def step(world, recorder, backlog=0):
+	"Performs one simulation step, reporting to world.metrics and the recorder (if any)"
+	if world.metrics is not None:
+		t = time.time()
+		world.simulate()
+		world.metrics.tick(time.time() - t, backlog)
+	else:
+		world.simulate()
+	if recorder is not None:
+		recorder.tick()
+
+def run_headless(world, ticks, recorder):
+	"Simulates as fast as possible, without a window"
+	while ticks == 0 or world.tick < ticks:
+		step(world, recorder)
+
+def run_lockstep(world, ticks, recorder):
+	"Simulates as fast as the controllers allow, see lockstep.py"
+	print "Waiting for %d controllers to send STEP" % world.lockstep.controllers
+	while ticks == 0 or world.tick < ticks:
+		world.lockstep.wait()
+		step(world, recorder)
+
+def run_render_process(world, ticks, recorder, render_process, tolerance=2):
+	"Simulates in real time (one step per millisecond), while a separate process draws the window"
+	from pacing import LoopScheduler
+	loop = LoopScheduler(tolerance, world.tick)
 	last_draw = -1000
-	while True:
-		t = get_ticks()
-		if (t - last_sim) > 1:
-			# Simulate world (~1 iteration once every millisecond or so)
-			# NB: This is kinda hard-coded into the logic currently,
-			# i.e. World.simulate() and Ball.simulate() and anyone else is 
-			# free to assume that a simulation step is 1ms. In particular,
-			# the ball computes it's friction coefficient like that.
-			world.simulate()
-			last_sim = t
-		
-		if (t - last_draw) > 40:
-			# Draw a frame once every 40 milliseconds or so (~25 fps)
-			BACKGROUND_BLUE = (120,119,253)
+	while (ticks == 0 or world.tick < ticks) and not render_process.closed:
+		due = loop.due(loop.now())	# The tick that should have been reached by now
+		if world.tick < due:
+			step(world, recorder, due - world.tick - 1)
+		else:
+			loop.sleep_until(loop.step_deadline(world.tick))
+		if world.tick - last_draw >= 40:
+			# Offer a frame every 40 simulated milliseconds (~25 fps). It is dropped if the renderer is still busy.
+			if render_process.offer(world):
+				last_draw = world.tick
+	render_process.close()
+
+def run_gui(world, ticks, recorder, render_share=0.25, tolerance=2):
+	import pygame
+	from render import Renderer, SCREEN_SIZE, BACKGROUND_BLUE
+	from pacing import FrameScheduler, LoopScheduler
+	INPUT_INTERVAL = 10	# Poll the window every 10ms
+
+	# Init graphics
+	pygame.init()
+	window = pygame.display.set_mode(SCREEN_SIZE)
+	pygame.display.set_caption('Robotex 2011 Simulator')
+	screen = pygame.display.get_surface()
+	renderer = Renderer(world, screen)
+	scheduler = FrameScheduler(render_share)
+
+	# Do the simulation/drawing/event cycle
+	loop = LoopScheduler(tolerance, world.tick)
+	last_input = -INPUT_INTERVAL
+	while ticks == 0 or world.tick < ticks:
+		t = loop.now()
+		# Simulate world (1 iteration every millisecond)
+		# NB: This is kinda hard-coded into the logic currently,
+		# i.e. World.simulate() and Ball.simulate() and anyone else is
+		# free to assume that a simulation step is 1ms. In particular,
+		# the ball computes it's friction coefficient like that.
+		# The simulation comes first: catch up with the schedule, only pausing every 20ms to handle the window.
+		due = loop.due(t)
+		while world.tick < due and (ticks == 0 or world.tick < ticks) and loop.now() - t < 20:
+			step(world, recorder, due - world.tick - 1)
+
+		# Draw a frame if the scheduler allows it (~25 fps, less if drawing is slow or the simulation is behind)
+		now = loop.now()
+		if scheduler.should_draw(now, due - world.tick):
 			screen.fill(BACKGROUND_BLUE)
-			world.draw(screen)
+			renderer.draw()
 			pygame.display.flip()
-			last_draw = t
-		
+			scheduler.drawn(now, loop.now())
+			if world.metrics is not None:
+				world.metrics.frame((loop.now() - now)/1000.0)
+
 		# Process input
-		input(pygame.event.get()) 
+		if now - last_input >= INPUT_INTERVAL:
+			input(pygame.event.get(), world)
+			last_input = now
+
+		# Sleep until the next step, frame or input poll is due
+		loop.sleep_until(min(loop.step_deadline(world.tick), scheduler.next_frame(), last_input + INPUT_INTERVAL))
 
 if __name__ == "__main__":
-	main()
\ No newline at end of file
+	main()
@@ -0,0 +1,137 @@
+"""
+Simulator health metrics, served as plain text over HTTP in the Prometheus exposition format.
+
+Attach a Metrics instance to the world (world.metrics = Metrics()) and the main loop and the robot servers
+will report to it. Serve it with MetricsServer(metrics, port).serve() and scrape http://host:port/metrics.
+Recording is a few arithmetic operations per event, cheap enough for the 1ms simulation loop.
+"""
+import time, thread, traceback
+
+from client import LatencyStats
+
+class Metrics:
+	"""
+	Collects:
+	  * simulation steps: count, steps per second, step duration histogram, backlog of missed steps
+	  * frames: drawing duration histogram
+	  * commands: count, rate and handling latency histogram per robot and command
+	  * number of connected clients
+	"""
+	WINDOW = 1.0	# Rates are computed over windows of this many seconds
+
+	def __init__(self):
+		self.ticks = 0
+		self.backlog = 0
+		self.ticks_per_second = 0.0
+		self.tick_stats = LatencyStats()		# Keys: "tick", "frame"
+		self.command_stats = {}					# robot name -> LatencyStats keyed by command
+		self.command_rates = {}					# robot name -> commands per second
+		self.clients = 0
+		self.window_start = time.time()
+		self.window_ticks = 0
+		self.window_commands = {}				# robot name -> number of commands at the start of the window
+
+	def tick(self, seconds, backlog=0):
+		"Records a simulation step which took the given time. backlog is the number of steps the simulation is behind schedule."
+		self.ticks += 1
+		self.backlog = backlog
+		self.tick_stats.record("tick", seconds)
+		now = time.time()
+		if now - self.window_start >= self.WINDOW:
+			dt = now - self.window_start
+			self.ticks_per_second = (self.ticks - self.window_ticks)/dt
+			for robot in self.command_stats.keys():
+				n = self._command_count(robot)
+				self.command_rates[robot] = (n - self.window_commands.get(robot, 0))/dt
+				self.window_commands[robot] = n
+			self.window_start = now
+			self.window_ticks = self.ticks
+
+	def frame(self, seconds):
+		"Records the time it took to draw a frame"
+		self.tick_stats.record("frame", seconds)
+
+	def command(self, robot, cmd, seconds):
+		"Records a command received by the server of the given robot and the time it took to handle it"
+		stats = self.command_stats.get(robot)
+		if stats is None:
+			stats = self.command_stats[robot] = LatencyStats()
+		stats.record(cmd, seconds)
+
+	def connected(self, delta):
+		"Called by the servers with +1 when a client connects and -1 when it disconnects"
+		self.clients += delta
+
+	def _command_count(self, robot):
+		stats = self.command_stats[robot]
+		return sum([stats.count(c) for c in stats.histograms.keys()])
+
+	def report(self):
+		"Returns the metrics as text in the Prometheus exposition format"
+		lines = ["# TYPE robotex_ticks_total counter",
+				 "robotex_ticks_total %d" % self.ticks,
+				 "# TYPE robotex_ticks_per_second gauge",
+				 "robotex_ticks_per_second %f" % self.ticks_per_second,
+				 "# TYPE robotex_tick_backlog gauge",
+				 "robotex_tick_backlog %d" % self.backlog,
+				 "# TYPE robotex_clients gauge",
+				 "robotex_clients %d" % self.clients]
+		for (key, name) in [("tick", "robotex_tick_seconds"), ("frame", "robotex_frame_seconds")]:
+			lines.append("# TYPE %s summary" % name)
+			lines.extend(self._summary(name, "", self.tick_stats, key))
+		lines.append("# TYPE robotex_command_seconds summary")
+		for robot in sorted(self.command_stats.keys()):
+			stats = self.command_stats[robot]
+			for cmd in sorted(stats.histograms.keys()):
+				lines.extend(self._summary("robotex_command_seconds", 'robot="%s",command="%s",' % (robot, cmd), stats, cmd))
+		lines.append("# TYPE robotex_commands_per_second gauge")
+		for robot in sorted(self.command_rates.keys()):
+			lines.append('robotex_commands_per_second{robot="%s"} %f' % (robot, self.command_rates[robot]))
+		return "\n".join(lines) + "\n"
+
+	def _summary(self, name, labels, stats, key):
+		if stats.count(key) == 0:
+			return []
+		lines = []
+		for q in [50, 90, 99]:
+			lines.append('%s{%squantile="%s"} %f' % (name, labels, q/100.0, stats.percentile(key, q)))
+		h = stats.histograms[key]
+		labels = labels.rstrip(",")
+		labels = "{%s}" % labels if labels else ""
+		lines.append("%s_sum%s %f" % (name, labels, h[1]))
+		lines.append("%s_count%s %d" % (name, labels, h[0]))
+		return lines
+
+class MetricsServer:
+	"""
+	Serves the metrics over HTTP (any path) in a separate thread.
+	Usage:
+	  MetricsServer(metrics, port=5080).serve()
+	"""
+	def __init__(self, metrics, port=5080):
+		self.metrics = metrics
+		self.port = port
+	def serve(self):
+		"""Starts the server in a separate thread"""
+		thread.start_new_thread(self._server_thread, tuple())
+	def _server_thread(self):
+		import socket
+		s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		s.bind(('', self.port))
+		s.listen(5)
+		print "Metrics available at http://localhost:%d/metrics" % self.port
+		while 1:
+			try:
+				conn, addr = s.accept()
+				conn.settimeout(1.0)
+				request = ""
+				while "\r\n\r\n" not in request and "\n\n" not in request:
+					data = conn.recv(1024)
+					if not data: break
+					request += data
+				body = self.metrics.report()
+				conn.sendall("HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+				conn.close()
+			except:
+				traceback.print_exc()
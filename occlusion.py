@@ -0,0 +1,94 @@
+"""
+Occlusion-aware camera.
+
+The plain camera (Robot.camera) reports the closest ball in the camera triangle, even if it is hidden behind
+another ball or the opponent. Here the objects in front of the robot are swept in the order of their distance,
+while the bearings (angles) they cover are collected into a set of intervals: a ball is visible if the bearing
+of its center is not covered yet by anything closer. That is O(n log n) per query.
+"""
+from bisect import bisect_left, bisect_right
+from math import sqrt, atan, atan2, asin
+
+from world import Ball
+
+class IntervalSet:
+	"""
+	A union of closed intervals, kept as sorted lists of disjoint intervals.
+	>>> s = IntervalSet()
+	>>> s.add(0, 1); s.add(2, 3); s.add(0.5, 2.5)
+	>>> (s.starts, s.ends)
+	([0], [3])
+	>>> (s.contains(1.5), s.contains(3.5))
+	(True, False)
+	"""
+	def __init__(self):
+		self.starts = []
+		self.ends = []
+
+	def contains(self, x):
+		i = bisect_right(self.starts, x) - 1
+		return i >= 0 and x <= self.ends[i]
+
+	def add(self, a, b):
+		i = bisect_left(self.ends, a)		# The first interval which ends after a
+		j = bisect_right(self.starts, b)	# and the ones up to here overlap [a, b]
+		if i < j:
+			a = min(a, self.starts[i])
+			b = max(b, self.ends[j - 1])
+		self.starts[i:j] = [a]
+		self.ends[i:j] = [b]
+
+def visible_balls(robot, objects, occlusion=True):
+	"""
+	Returns the (forward, left) of the balls in the camera triangle of the robot, nearest first.
+	With occlusion, the balls hidden behind closer balls or robots (bounding circles) are left out.
+	The robot's own grabbed ball does not hide anything.
+	>>> from world import World, Point
+	>>> from telliskivi import Robot
+	>>> w = World()
+	>>> r = Robot(w, "A", "TOPLEFT")		# At (38, 38), facing (1, 0)
+	>>> for x in [100, 200, 300]:
+	...     w.add_object(Ball(Point(x, 38)))
+	>>> w.add_object(Ball(Point(200, 80)))
+	>>> [(int(round(f)), int(round(l))) for (f, l) in visible_balls(r, w.objects, occlusion=False)]
+	[(62, 0), (162, 0), (162, 42), (262, 0)]
+	>>> [(int(round(f)), int(round(l))) for (f, l) in visible_balls(r, w.objects)]
+	[(62, 0), (162, 42)]
+	"""
+	depth = robot.CAMERA_DEPTH
+	ratio = float(robot.CAMERA_SIDE)/depth
+	half_angle = atan(ratio)
+	grabbed = getattr(robot, 'grabbed_ball', None)
+	items = []
+	for o in objects:
+		if o is robot:
+			continue
+		v = o.center - robot.center
+		f = robot.forward.inner_product(v)
+		if f <= -o.radius or f >= depth + o.radius:
+			continue
+		l = robot.left.inner_product(v)
+		in_view = isinstance(o, Ball) and f > 0 and f < depth and abs(l) < f*ratio
+		if not occlusion:
+			if in_view:
+				items.append((f*f + l*l, f, l))
+			continue
+		d = sqrt(f*f + l*l)
+		if d <= o.radius:
+			continue	# Touching the camera
+		bearing = atan2(l, f)
+		width = asin(o.radius/d)
+		if abs(bearing) - width >= half_angle:
+			continue	# Outside the view, cannot hide anything in it either
+		items.append((d, bearing, width, f, l, in_view, o is not grabbed))
+	items.sort()
+	if not occlusion:
+		return [(f, l) for (d, f, l) in items]
+	covered = IntervalSet()
+	visible = []
+	for (d, bearing, width, f, l, in_view, hides) in items:
+		if in_view and not covered.contains(bearing):
+			visible.append((f, l))
+		if hides:
+			covered.add(bearing - width, bearing + width)
+	return visible
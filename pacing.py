@@ -0,0 +1,118 @@
+"""
+Pacing of the real-time loops. The simulation has priority: frames are only drawn within a CPU budget,
+and skipped altogether while the simulation is behind its 1ms-per-step schedule (FrameScheduler).
+In between, the loop sleeps until the next step, frame or input poll is due (LoopScheduler), so that
+a simulator only uses the CPU it actually needs.
+"""
+import time
+
+class FrameScheduler:
+	"""
+	Decides when the GUI loop should draw a frame. All times are in milliseconds.
+	  render_share - fraction of the time drawing may take, the rest is left for the simulation
+	  min_interval - shortest time between frames (40 = 25 fps)
+	  max_interval - longest time between frames, even when the simulation is behind (so the window stays alive)
+	  max_backlog  - how many steps the simulation may be behind schedule before frames are skipped
+	The frame interval grows when drawing is slow: with frames taking 20ms and render_share 0.25 a frame is drawn every 80ms.
+	>>> s = FrameScheduler(render_share=0.25, min_interval=40)
+	>>> s.should_draw(0, 0)
+	True
+	>>> s.drawn(0, 20)
+	>>> s.interval()
+	80.0
+	>>> (s.should_draw(50, 0), s.should_draw(80, 0), s.should_draw(80, 100), s.should_draw(1000, 100))
+	(False, True, False, True)
+	"""
+	def __init__(self, render_share=0.25, min_interval=40, max_interval=1000, max_backlog=20):
+		self.render_share = render_share
+		self.min_interval = min_interval
+		self.max_interval = max_interval
+		self.max_backlog = max_backlog
+		self.frame_time = None		# Smoothed time it takes to draw a frame
+		self.last_frame = None		# Time when the last frame was started
+
+	def interval(self):
+		"Current time between frames"
+		if self.frame_time is None:
+			return self.min_interval
+		return max(self.min_interval, self.frame_time/self.render_share)
+
+	def should_draw(self, now, backlog):
+		"Whether a frame should be drawn now, given the number of steps the simulation is behind schedule"
+		if self.last_frame is None:
+			return True
+		since = now - self.last_frame
+		if since >= self.max_interval:
+			return True
+		return since >= self.interval() and backlog <= self.max_backlog
+
+	def next_frame(self):
+		"The earliest time the next frame may be drawn"
+		if self.last_frame is None:
+			return 0
+		return self.last_frame + self.interval()
+
+	def drawn(self, start, end):
+		"Reports a frame drawn between the given times"
+		t = float(end - start)
+		self.frame_time = t if self.frame_time is None else 0.8*self.frame_time + 0.2*t
+		self.last_frame = start
+
+class LoopScheduler:
+	"""
+	Lets a real-time loop sleep until its next deadline instead of polling. Times are in milliseconds since the start.
+	  tolerance  - how late a simulation step may be done. Steps are done in batches as they fall due, so the loop
+	               wakes up about 1000/tolerance times a second while keeping every step within tolerance of its schedule
+	  first_tick - the world's tick at the start, which is not 0 when a match is resumed from a checkpoint
+	The sleeps are shortened by the typical oversleep of the OS, so that the loop wakes up on time.
+	>>> t = [0.0]
+	>>> def oversleeping(s):		# Sleeps 0.3ms too long
+	...     t[0] += s + 0.0003
+	>>> loop = LoopScheduler(2, clock=lambda: t[0], sleep=oversleeping)
+	>>> loop.sleep_until(5)
+	>>> round(loop.now(), 3)
+	5.3
+	>>> for deadline in range(10, 200, 5):
+	...     loop.sleep_until(deadline)
+	>>> round(loop.now(), 2)
+	195.0
+	>>> loop.sleep_until(100)		# Has passed
+	>>> round(loop.now(), 2)
+	195.0
+	>>> t = [0.0]
+	>>> loop = LoopScheduler(2, first_tick=5000, clock=lambda: t[0], sleep=oversleeping)
+	>>> loop.sleep_until(loop.step_deadline(5000))
+	>>> loop.due(loop.now())
+	5002
+	"""
+	def __init__(self, tolerance=2, first_tick=0, clock=time.time, sleep=time.sleep):
+		self.tolerance = tolerance
+		self.first_tick = first_tick
+		self.clock = clock
+		self.sleep = sleep
+		self.start = clock()
+		self.oversleep = 0.0		# Smoothed time by which the sleeps overshoot
+
+	def now(self):
+		return (self.clock() - self.start)*1000.0
+
+	def due(self, t):
+		"The tick the world should have reached at time t"
+		return self.first_tick + int(t)
+
+	def step_deadline(self, tick):
+		"When to wake up for the step number tick (it is due when due(now()) > tick)"
+		return tick - self.first_tick + self.tolerance
+
+	def sleep_until(self, deadline):
+		"Sleeps until the deadline, returns at once if it has passed"
+		t = self.now()
+		remaining = deadline - t
+		if remaining <= 0:
+			return
+		if remaining > self.oversleep:
+			remaining -= self.oversleep
+		# else sleep the rest (a bit late) rather than return early and have the loop spin until the deadline
+		self.sleep(remaining/1000.0)
+		over = self.now() - t - remaining
+		self.oversleep = 0.8*self.oversleep + 0.2*max(0.0, over)
@@ -0,0 +1,358 @@
+"""
+Multi-process ball physics for huge arenas (stress tests with 100k+ balls).
+
+StripWorld is a World whose balls do not live in world.objects, but in shared memory arrays, simulated by
+worker processes. The field is split into vertical strips, one per worker. On every step each worker
+  * selects the balls in its strip, plus a halo of the balls of the neighbouring strips near its edges,
+  * moves them (the same friction and wall rules as Ball), resolves ball-ball contacts using a cell grid,
+  * writes back its own balls only, into the other half of the double-buffered state, and scores goals,
+so the workers never write what another one reads. A step has a single synchronisation point: the main process
+releases the workers, waits until all are done, and then handles the robots (as in World.simulate).
+The robots only ever see the balls near them: those are materialized as ordinary Ball objects ("proxies")
+in world.objects for the step, so grabbing, shooting and robot collisions work unchanged. The camera requires
+the sensor engine (sensors.py), which reads all the ball positions from the arrays.
+
+Contacts are resolved simultaneously (each ball takes half of the correction), rather than pair by pair as in
+World.simulate, so the trajectories of colliding balls agree with the serial engine only within a tolerance.
+Free-rolling and bouncing balls match it exactly. All balls must have the same radius.
+A reset (World.reset) stops the workers, and the first step of the new match starts them on the new balls.
+Not supported: fork(), drawing balls other than the proxies, ball events in the event log.
+Requires numpy.
+Usage:
+  w = StripWorld(size=(20000, 12000), workers=8)
+  for ...: w.add_object(Ball(...))		# All balls must be added before the first step
+  w.add_object(robot)
+  w.simulate() ...
+  w.close()
+"""
+import multiprocessing, multiprocessing.sharedctypes
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+from world import World, Ball, Point
+
+FRICTION_FORCE = 0.00005	# As in Ball.simulate
+NEAR = 60					# Balls closer than this to a robot's center are given to the robots as proxies
+MAX_ROBOTS = 16
+MAX_NEAR = 4096				# Per worker
+
+def _shared(typecode, n):
+	"Returns a shared memory array and a numpy view of it"
+	raw = multiprocessing.sharedctypes.RawArray(typecode, max(n, 1))
+	return raw, numpy.ctypeslib.as_array(raw)[:n]
+
+class StripWorld(World):
+	"""
+	A World with its balls simulated by `workers` processes (by default one per CPU), see the module docstring.
+	Balls can only be added before the first simulate(), their ids are indices into the state arrays.
+	"""
+	def __init__(self, size=(900, 600), workers=None, sensor_engine=True):
+		if numpy is None:
+			raise ImportError("StripWorld requires numpy")
+		World.__init__(self, sensor_engine, size)
+		self.workers = workers or multiprocessing.cpu_count()
+		self.new_balls = []		# Balls added before the start
+		self.radius = None
+		self.processes = None
+		self.robots = []
+		self.proxies = {}		# ball index -> Ball, the balls near the robots
+		self.scored = (0, 0)	# Goals counted by the workers so far
+
+	def add_object(self, obj):
+		if not isinstance(obj, Ball):
+			World.add_object(self, obj)
+			self.robots.append(obj)
+			return
+		if self.processes is not None:
+			raise ValueError("Balls must be added to a StripWorld before the first simulation step")
+		if self.radius is not None and obj.radius != self.radius:
+			raise ValueError("All balls of a StripWorld must have the same radius")
+		self.radius = obj.radius
+		obj.id = len(self.new_balls)
+		self.new_balls.append(obj)
+
+	def fork(self):
+		raise NotImplementedError("StripWorld cannot be forked")
+
+	def reset(self, seed=None):
+		"""
+		Starts a new match in place (see World.reset). The workers are stopped, the balls of the new match
+		are added as before the first step, and the next simulate() starts the workers again.
+		>>> from telliskivi import Robot
+		>>> w = StripWorld(workers=2)
+		>>> w.new_match = lambda seed: [(300, 300), (600, 300), (450, 100)]
+		>>> w.add_object(Ball(Point(8, 300)))			# In the left goal
+		>>> w.add_object(Robot(w, "Robot", "TOPLEFT"))
+		>>> for i in range(10):
+		...    w.simulate()
+		>>> w.reset(1)
+		>>> w.simulate()
+		>>> (w.scoreLeft, len(w.ball_positions()), w.match, w.tick)
+		(0, 3, 1, 11)
+		>>> w.close()
+		"""
+		self.close()
+		self.new_balls = []
+		self.radius = None
+		self.robots = []
+		self.proxies = {}
+		self.scored = (0, 0)
+		World.reset(self, seed)
+
+	def ball_positions(self):
+		if self.processes is None:
+			return [(b.center.x, b.center.y) for b in self.new_balls]
+		return self.pos[self.parity][self.alive != 0]
+
+	def start(self):
+		"Allocates the shared state and starts the workers. Done automatically by the first simulate()."
+		n = len(self.new_balls)
+		self._raw_pos, pos = _shared('d', 2*n*2)
+		self._raw_vel, vel = _shared('d', 2*n*2)
+		self._raw_alive, self.alive = _shared('b', n)
+		self._raw_control, self.control = _shared('i', 2)		# parity, stop
+		self._raw_scores, self.scores = _shared('i', self.workers*2)
+		self._raw_robots, self.robot_pos = _shared('d', MAX_ROBOTS*2)
+		self._raw_near, self.near = _shared('i', self.workers*(MAX_NEAR + 1))
+		self.pos = pos.reshape((2, n, 2))
+		self.vel = vel.reshape((2, n, 2))
+		self.robot_pos = self.robot_pos.reshape((MAX_ROBOTS, 2))
+		self.near = self.near.reshape((self.workers, MAX_NEAR + 1))		# count, indices
+		for (i, b) in enumerate(self.new_balls):
+			self.pos[0, i] = (b.center.x, b.center.y)
+			self.vel[0, i] = (b.v.x, b.v.y)
+		self.alive[:] = 1
+		self.parity = 0
+		self.control[:] = 0
+		self.robot_pos[:] = numpy.inf
+		self.go = [multiprocessing.Semaphore(0) for k in range(self.workers)]	# One each, or a fast worker might take two
+		self.done = multiprocessing.Semaphore(0)
+		bounds = numpy.linspace(0, self.width, self.workers + 1)
+		bounds[0], bounds[-1] = -numpy.inf, numpy.inf
+		shared = (self._raw_pos, self._raw_vel, self._raw_alive, self._raw_control, self._raw_scores,
+				  self._raw_robots, self._raw_near)
+		self.processes = []
+		for k in range(self.workers):
+			p = multiprocessing.Process(target=_worker_main,
+										args=(k, bounds[k], bounds[k + 1], n, self.radius or 0, self.width, self.height,
+											  shared, self.go[k], self.done))
+			p.daemon = True
+			p.start()
+			self.processes.append(p)
+		self.new_balls = []
+
+	def close(self):
+		"Stops the workers"
+		if self.processes is not None:
+			self.control[1] = 1
+			for go in self.go:
+				go.release()
+			for p in self.processes:
+				p.join()
+			self.processes = None
+
+	def simulate(self):
+		for t in self.tasks[:]:
+			if not t():
+				self.tasks.remove(t)
+		if self.processes is None:
+			self.start()
+		self._proxies_changed()
+		# The synchronisation point: the workers do the balls' step, then the robots do theirs
+		for go in self.go:
+			go.release()
+		for p in self.processes:
+			self.done.acquire()
+		self.parity = 1 - self.parity
+		self.control[0] = self.parity
+		self._load_proxies()
+		events = self.events
+		robots = self.robots
+		for r in robots:
+			r.simulate()
+		for r in robots:
+			for (k, w) in enumerate(self.walls):
+				if r.wall_check(w) and events is not None:
+					self._log_wall(r, k)
+		for i in range(len(robots)):
+			for j in range(0, i):
+				if robots[i].collision_check(robots[j]) and events is not None:
+					self._log_collision(robots[i], robots[j])
+		for r in robots:
+			for b in self.proxies.values():
+				if r.collision_check(b) and events is not None:
+					self._log_collision(r, b)
+		self._store_proxies()
+		scored = self.scores.reshape((self.workers, 2)).sum(axis=0)
+		self.scoreLeft += int(scored[0]) - self.scored[0]
+		self.scoreRight += int(scored[1]) - self.scored[1]
+		self.scored = (int(scored[0]), int(scored[1]))
+		self.tick += 1
+		if self.sensors is not None:
+			self.sensors.update()
+
+	def _proxies_changed(self):
+		"Changes the robot servers made to the proxies between the steps (grab, shoot) take precedence over the physics"
+		pos, vel = self.pos[self.parity], self.vel[self.parity]
+		for (i, b) in self.proxies.items():
+			if (b.center.x, b.center.y, b.v.x, b.v.y) != b.stored:
+				pos[i] = (b.center.x, b.center.y)
+				vel[i] = (b.v.x, b.v.y)
+
+	def _load_proxies(self):
+		"Makes Ball objects of the balls near the robots (and the grabbed ones) and puts them into world.objects"
+		pos, vel = self.pos[self.parity], self.vel[self.parity]
+		indices = set()
+		for k in range(self.workers):
+			indices.update(self.near[k, 1:1 + self.near[k, 0]].tolist())
+		for r in self.robots:
+			g = getattr(r, 'grabbed_ball', None)
+			if g is not None and getattr(g, 'id', None) in self.proxies:
+				indices.add(g.id)
+		proxies = {}
+		for i in indices:
+			if not self.alive[i]:
+				continue
+			b = self.proxies.get(i)
+			if b is None:
+				b = Ball(Point(0, 0), self.radius)
+				b.id = i
+			b.center = Point(float(pos[i, 0]), float(pos[i, 1]))
+			b.v = Point(float(vel[i, 0]), float(vel[i, 1]))
+			proxies[i] = b
+		self.proxies = proxies
+		self.objects = self.robots + list(proxies.values())
+
+	def _store_proxies(self):
+		pos, vel = self.pos[self.parity], self.vel[self.parity]
+		for (i, b) in self.proxies.items():
+			pos[i] = (b.center.x, b.center.y)
+			vel[i] = (b.v.x, b.v.y)
+			b.stored = (b.center.x, b.center.y, b.v.x, b.v.y)
+		for (k, r) in enumerate(self.robots[:MAX_ROBOTS]):
+			self.robot_pos[k] = (r.center.x, r.center.y)
+
+def _worker_main(k, x0, x1, n, radius, width, height, shared, go, done):
+	"The worker process of strip [x0, x1)"
+	raw_pos, raw_vel, raw_alive, raw_control, raw_scores, raw_robots, raw_near = shared
+	view = lambda raw, count: numpy.ctypeslib.as_array(raw)[:count]
+	pos = view(raw_pos, 2*n*2).reshape((2, n, 2))
+	vel = view(raw_vel, 2*n*2).reshape((2, n, 2))
+	alive = view(raw_alive, n)
+	control = view(raw_control, 2)
+	scores = view(raw_scores, len(raw_scores)).reshape((-1, 2))
+	robot_pos = view(raw_robots, MAX_ROBOTS*2).reshape((MAX_ROBOTS, 2))
+	near = view(raw_near, len(raw_near)).reshape((-1, MAX_NEAR + 1))
+	halo = 2*radius + 2		# Balls move less than a pixel per step
+	while 1:
+		go.acquire()
+		if control[1]:
+			return
+		cur = control[0]
+		x = pos[cur, :, 0]
+		local = numpy.nonzero((alive != 0) & (x >= x0 - halo) & (x < x1 + halo))[0]
+		lx = x[local]
+		own = (lx >= x0) & (lx < x1)
+		# Own balls first, then the halo
+		local = numpy.concatenate((local[own], local[~own]))
+		n_own = int(own.sum())
+		p, v = _step(pos[cur][local], vel[cur][local], n_own, radius, width, height)
+		p, v = p[:n_own], v[:n_own]
+		mine = local[:n_own]
+		# Goals
+		in_goal = (p[:, 1] > height/2 - 70) & (p[:, 1] < height/2 + 70)
+		left = in_goal & (p[:, 0] < 5 + radius)
+		right = in_goal & (p[:, 0] > width - 5 - radius)
+		if left.any() or right.any():
+			alive[mine[left | right]] = 0
+			scores[k, 0] += int(left.sum())
+			scores[k, 1] += int(right.sum())
+		pos[1 - cur][mine] = p
+		vel[1 - cur][mine] = v
+		# The balls near the robots, for the proxies
+		close = numpy.zeros(n_own, dtype=bool)
+		for r in robot_pos:
+			if numpy.isfinite(r[0]):
+				d = p - r
+				close |= (d*d).sum(axis=1) < NEAR*NEAR
+		close &= ~(left | right)
+		c = mine[close][:MAX_NEAR]
+		near[k, 0] = len(c)
+		near[k, 1:1 + len(c)] = c
+		done.release()
+
+def _step(p, v, n_own, radius, width, height):
+	"""
+	One step of the given balls, returns the new (positions, velocities). Only the first n_own balls are moved by the
+	contacts, the rest (the halo) are only there to be collided with.
+	>>> p, v = _step(numpy.array([[100.0, 100.0], [300.0, 5.0]]), numpy.array([[0.1, 0.0], [0.0, -1.0]]), 2, 4.3, 900, 600)
+	>>> p.round(6).tolist(), v.round(6).tolist()
+	([[100.1, 100.0], [300.0, 4.3]], [[0.09995, 0.0], [0.0, 0.99995]])
+	"""
+	p = p.copy()
+	v = v.copy()
+	# Move and apply the friction (Ball.simulate)
+	s = numpy.sqrt((v*v).sum(axis=1))
+	moving = s > 0
+	p[moving] += v[moving]
+	v[moving] *= (numpy.maximum(s[moving] - FRICTION_FORCE, 0)/s[moving])[:, numpy.newaxis]
+	# Walls (Ball.wall_check)
+	for (axis, limit) in [(0, width), (1, height)]:
+		low = p[:, axis] < radius
+		p[low, axis] = radius
+		v[low & (v[:, axis] < 0), axis] *= -1
+		high = p[:, axis] > limit - radius
+		p[high, axis] = limit - radius
+		v[high & (v[:, axis] > 0), axis] *= -1
+	# Contacts between the balls
+	i, j = _contacts(p, n_own, 2*radius)
+	if len(i) > 0:
+		d = p[j] - p[i]
+		dist = numpy.sqrt((d*d).sum(axis=1))
+		hit = (dist < 2*radius) & (dist > 0)
+		i, d, dist = i[hit], d[hit], dist[hit]
+		normal = d/dist[:, numpy.newaxis]
+		dp = numpy.zeros((n_own, 2))
+		dv = numpy.zeros((n_own, 2))
+		numpy.add.at(dp, i, -normal*((2*radius - dist)/2)[:, numpy.newaxis])
+		towards = ((v[j[hit]] - v[i])*normal).sum(axis=1)
+		approaching = towards < 0
+		numpy.add.at(dv, i[approaching], normal[approaching]*towards[approaching][:, numpy.newaxis])
+		p[:n_own] += dp
+		v[:n_own] += dv
+	return (p, v)
+
+def _contacts(p, n_own, cell):
+	"""
+	Returns index arrays (i, j) of candidate pairs closer than one cell, for the first n_own balls i, using a cell grid
+	>>> i, j = _contacts(numpy.array([[10.0, 10.0], [15.0, 10.0], [50.0, 50.0], [12.0, 16.0]]), 2, 8.6)
+	>>> sorted(zip(i.tolist(), j.tolist()))
+	[(0, 1), (0, 3), (1, 0), (1, 3)]
+	"""
+	c = numpy.floor(p/cell).astype(numpy.int64)
+	stride = int(c[:, 1].max()) + 3 if len(c) > 0 else 1
+	key = c[:, 0]*stride + c[:, 1]
+	order = numpy.argsort(key, kind='mergesort')
+	sorted_key = key[order]
+	found_i, found_j = [], []
+	# Half of the neighbourhood is enough, every pair is found once and used in both directions
+	for (dx, dy) in [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]:
+		target = sorted_key + (dx*stride + dy)		# In key order, so that the lookups go through memory in order
+		lo = numpy.searchsorted(sorted_key, target, 'left')
+		count = numpy.searchsorted(sorted_key, target, 'right') - lo
+		for m in range(int(count.max()) if len(count) > 0 else 0):
+			sel = numpy.nonzero(count > m)[0]
+			if dx == 0 and dy == 0:
+				sel = sel[lo[sel] + m > sel]	# Within a cell, each pair once
+			found_i.append(order[sel])
+			found_j.append(order[lo[sel] + m])
+	if len(found_i) == 0:
+		return (numpy.zeros(0, dtype=int), numpy.zeros(0, dtype=int))
+	i = numpy.concatenate(found_i)
+	j = numpy.concatenate(found_j)
+	i, j = numpy.concatenate((i, j)), numpy.concatenate((j, i))
+	mine = i < n_own
+	return (i[mine], j[mine])
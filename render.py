@@ -0,0 +1,191 @@
+"""
+Pygame rendering of the World.
+
+The simulation core (world.py) does not depend on pygame. A Renderer is attached to a world only
+when it needs to be drawn:
+  renderer = Renderer(world, screen)
+  renderer.draw()
+
+A FrameRecorder renders the world on an offscreen surface instead, and exports the frames
+(as an image sequence or a raw video stream piped to an encoder) in a background thread.
+"""
+import pygame, thread, subprocess, traceback, Queue
+from pygame.locals import *
+from pygame import draw
+
+SCREEN_SIZE = (1060, 760)	# Size of the field + contestant area. (5300 x 3800)
+BACKGROUND_BLUE = (120,119,253)
+
+class Renderer:
+	"""
+	Draws the field, the scores and all the world objects on a pygame surface.
+	The field is drawn in the center of the given screen surface. Each object is drawn via its draw(field) method.
+	"""
+	def __init__(self, world, screen):
+		self.world = world
+		self.screen = screen
+		sw, sh = screen.get_size()
+		scx, scy = sw/2, sh/2
+		left, top = scx - world.width/2, scy - world.height/2
+		# Create a sub-image, containing the whole of the world in it.
+		self.field = screen.subsurface(Rect(left, top, world.width, world.height))
+		if not pygame.font.get_init():
+			pygame.font.init()
+		self.font = pygame.font.Font(None, 60)
+
+	def draw(self):
+		world = self.world
+		# The field is a rect in the center of the screen
+		BLACK = (0,0,0)
+		WHITE = (255,255,255)
+		GREEN = (43,252,43)
+		self.field.fill(GREEN)	# Green fill
+		draw.rect(self.field, WHITE, self.field.get_rect(), 20)	# White border
+		draw.rect(self.field, BLACK, self.field.get_rect(), 1)		# Black border
+		draw.rect(self.field, BLACK, (10, 10, world.cx-5-10, world.height-10-10), 1)	# Black square (left)
+		draw.rect(self.field, BLACK, (world.cx + 5, 10, world.cx-5-10, world.height-10-10), 1)	# Black square (right)
+		draw.circle(self.field, WHITE, (world.cx, world.cy), 80, 10)	# Central circle (white)
+		draw.circle(self.field, BLACK, (world.cx, world.cy), 80-10, 1)		# Central circle (black, inner)
+		draw.circle(self.field, BLACK, (world.cx, world.cy), 80, 1)			# Central circle (black, outer)
+		draw.line(self.field, WHITE, (world.cx-1, 0+1), (world.cx-1, world.height-2),10)	# Central divider line (white)
+
+		# Arcs
+		#1
+		draw.arc(self.field, WHITE, (10 - 100, 265 - 100, 200, 200), 0, 3.1415/2, 10)			# Left goal, upper arc, white filling
+		draw.arc(self.field, BLACK, (10 - 100, 265 - 100, 200, 200), 0, 3.1415/2, 1)			# Left goal, upper arc, black, outer
+		draw.arc(self.field, BLACK, (10 - 100 + 10, 265 - 100 + 10, 200 - 20, 200 - 20), 0, 3.1415/2, 1)	# Left goal, upper arc, black inner
+
+		#2
+		draw.arc(self.field, WHITE, (10 - 100, 265 - 100 + 70, 200, 200), 3*3.1415/2, 2*3.1415, 10)			# Left goal, lower arc, white filling
+		draw.arc(self.field, BLACK, (10 - 100, 265 - 100 + 70, 200, 200), 3*3.1415/2, 2*3.1415, 1)			# Left goal, lower arc, black, outer
+		draw.arc(self.field, BLACK, (10 - 100 + 10, 265 - 100 + 10 + 70, 200 - 20, 200 - 20), 3*3.1415/4, 2*3.1415, 1)	# Left goal, lower arc, black inner
+
+		#3
+		draw.arc(self.field, WHITE, (world.width - 10 - 100, 265 - 100, 200, 200), 3.1415/2, 3.1415, 10)			# Right goal, upper arc, white filling
+		draw.arc(self.field, BLACK, (world.width - 10 - 100, 265 - 100, 200, 200), 3.1415/2, 3.1415,  1)			# Right goal, upper arc, black, outer
+		draw.arc(self.field, BLACK, (world.width - 10 - 100 + 10, 265 - 100 + 10, 200 - 20, 200 - 20), 3.1415/2, 3.1415, 1)	# Left goal, upper arc, black inner
+
+		#4
+		draw.arc(self.field, WHITE, (world.width - 10 - 100, 265 - 100 + 70, 200, 200), 3.1415, 3*3.1415/2, 10)			# Right goal, lower arc, white filling
+		draw.arc(self.field, BLACK, (world.width - 10 - 100, 265 - 100 + 70, 200, 200), 3.1415, 3*3.1415/2, 1)			# Right goal, lower arc, black, outer
+		draw.arc(self.field, BLACK, (world.width - 10 - 100 + 10, 265 - 100 + 10 + 70, 200 - 20, 200 - 20),  3.1415, 3*3.1415/2, 1)	# Right goal, lower arc, black inner
+		
+		# Arc connectors
+		draw.line(self.field, WHITE, (10 + 100 - 5, 265), (10 + 100 - 5, 265 + 70), 10) # Left goal, arc connector, white filling
+		draw.line(self.field, BLACK, (10 + 100 - 10, 265), (10 + 100 - 10, 265 + 70), 1) # Left goal, arc connector, black inner
+		draw.line(self.field, BLACK, (10 + 100, 265), (10 + 100, 265 + 70), 1) # Left goal, arc connector, black outer
+		
+		draw.line(self.field, WHITE, (world.width - 10 - 100 + 5, 265), (world.width - 10 - 100 + 5, 265 + 70), 10) # Right goal, arc connector, white filling
+		draw.line(self.field, BLACK, (world.width - 10 - 100 + 10, 265), (world.width - 10 - 100 + 10, 265 + 70), 1) # Right goal, arc connector, black inner
+		draw.line(self.field, BLACK, (world.width - 10 - 100, 265), (world.width - 10 - 100, 265 + 70), 1) # Right goal, arc connector, black outer
+		
+		# Left goal
+		draw.rect(self.screen, (163, 163, 46), (self.field.get_offset()[0]-50, self.field.get_offset()[1]+world.cy-70, 50+10, 140), 0)
+		text = self.font.render(str(world.scoreLeft), True, BLACK, (163, 163, 46))
+		textRect = text.get_rect()
+		# Center the rectangle
+		textRect.centerx = self.field.get_offset()[0]-50 + 25 + 5
+		textRect.centery = self.field.get_offset()[1]+world.cy
+		# Blit the text
+		self.screen.blit(text, textRect)
+		
+		# Right goal
+		draw.rect(self.screen, (16, 57, 125), (self.field.get_offset()[0]+world.width-10, self.field.get_offset()[1]+world.cy-70, 50+10, 140), 0)
+		text = self.font.render(str(world.scoreRight), True, WHITE, (16, 57, 125))
+		textRect = text.get_rect()
+		textRect.centerx = self.field.get_offset()[0]+world.width - 10 + 30
+		textRect.centery = self.field.get_offset()[1]+world.cy
+		self.screen.blit(text, textRect)
+		
+		# Cross in the middle
+		#draw.line(self.field, BLACK, (world.cx-10, world.cy), (world.cx+10, world.cy))
+		#draw.line(self.field, BLACK, (world.cx, world.cy-10), (world.cx, world.cy+10))
+		
+		for o in world.objects:
+			o.draw(self.field)
+		
+
+class FrameRecorder:
+	"""
+	Records a match without a display. Every `every` simulation steps (40 steps = 25 fps of simulated time)
+	the world is drawn on an offscreen surface, optionally scaled to `size`, and queued for export.
+	Exactly one of the following outputs must be given:
+	  pattern - file name pattern of an image sequence, e.g. "frames/%05d.png" (format is chosen by extension)
+	  command - shell command reading raw RGB24 frames from its stdin. The command may refer to
+	            %(width)d, %(height)d and %(fps)f, e.g.
+	            "ffmpeg -f rawvideo -pix_fmt rgb24 -s %(width)dx%(height)d -r %(fps)f -i - match.mp4"
+	Image compression and the encoder pipe are served by a background thread, the simulation only pays
+	for drawing. If the thread falls more than queue_size frames behind, tick() blocks until it catches up.
+	Usage:
+	  rec = FrameRecorder(world, pattern="frames/%05d.png")
+	  while ...:
+	      world.simulate()
+	      rec.tick()
+	  rec.close()
+	"""
+	def __init__(self, world, pattern=None, command=None, every=40, size=None, queue_size=100):
+		if (pattern is None) == (command is None):
+			raise ValueError("Exactly one of pattern and command must be given")
+		self.world = world
+		self.pattern = pattern
+		self.every = every
+		self.size = size if size is not None else SCREEN_SIZE
+		self.screen = pygame.Surface(SCREEN_SIZE)
+		self.renderer = Renderer(world, self.screen)
+		self.frames = 0
+		self.last_frame = None
+		self.process = None
+		if command is not None:
+			fps = 1000.0/every		# A simulation step is 1ms
+			self.process = subprocess.Popen(command % {'width': self.size[0], 'height': self.size[1], 'fps': fps},
+											shell=True, stdin=subprocess.PIPE)
+		self.queue = Queue.Queue(queue_size)
+		self.done_lock = thread.allocate_lock()
+		self.done_lock.acquire()	# Released by the writer thread once it has exported everything
+		thread.start_new_thread(self._writer_thread, tuple())
+
+	def tick(self):
+		"Call after each World.simulate(). Captures a frame if one is due."
+		if self.last_frame is None or self.world.tick - self.last_frame >= self.every:
+			self.capture()
+
+	def capture(self):
+		"Draws the current state of the world and queues it for export"
+		self.screen.fill(BACKGROUND_BLUE)
+		self.renderer.draw()
+		if self.size != SCREEN_SIZE:
+			frame = pygame.transform.smoothscale(self.screen, self.size)
+		else:
+			frame = self.screen.copy()
+		if self.process is not None:
+			frame = pygame.image.tostring(frame, 'RGB')
+		self.queue.put((self.frames, frame))
+		self.frames += 1
+		self.last_frame = self.world.tick
+
+	def close(self):
+		"Waits until all queued frames are exported and closes the encoder (if any)"
+		self.queue.put(None)
+		self.done_lock.acquire()
+		if self.process is not None:
+			self.process.stdin.close()
+			self.process.wait()
+
+	def _writer_thread(self):
+		failed = False
+		while 1:
+			item = self.queue.get()
+			if item is None:
+				break
+			if failed:
+				continue	# Keep draining the queue so that the simulation does not block
+			n, frame = item
+			try:
+				if self.process is not None:
+					self.process.stdin.write(frame)
+				else:
+					pygame.image.save(frame, self.pattern % n)
+			except:
+				traceback.print_exc()
+				failed = True
+		self.done_lock.release()
@@ -0,0 +1,126 @@
+"""
+Rendering in a separate process.
+
+The simulation process sends compact pose snapshots of the world to a render process over a pipe.
+The render process keeps its own (non-simulated) copy of the world, applies the snapshots to it and
+draws it with the usual Renderer. A snapshot is only sent when the render process has finished the
+previous frame, so a slow renderer drops frames instead of delaying World.simulate.
+Usage:
+  rp = RenderProcess([("telliskivi", r1.name, "TOPLEFT", pose(r1)), ("telliskivi", r2.name, "BOTTOMRIGHT", pose(r2))],
+                     (world.width, world.height))
+  while not rp.closed:
+      world.simulate()
+      ...
+      rp.offer(world)
+  rp.close()
+"""
+import multiprocessing
+
+from world import Point, Ball
+
+def pose(robot):
+	"Returns the pose of a robot as (x, y, forward x, forward y)"
+	return (robot.center.x, robot.center.y, robot.forward.x, robot.forward.y)
+
+def set_pose(robot, p):
+	x, y, fx, fy = p
+	robot.center = Point(x, y)
+	robot.forward = Point(fx, fy)
+	robot.left = Point(-fy, fx)
+
+def snapshot(world):
+	"Returns the poses of all objects as (tick, score left, score right, [(x, y) of balls], [(x, y, fx, fy) of robots])"
+	balls = []
+	robots = []
+	for o in world.objects:
+		if isinstance(o, Ball):
+			balls.append((o.center.x, o.center.y))
+		else:
+			robots.append(pose(o))
+	return (world.tick, world.scoreLeft, world.scoreRight, balls, robots)
+
+def apply_snapshot(world, robots, s):
+	"Moves the objects of a (non-simulated) world to the poses given in a snapshot"
+	world.tick, world.scoreLeft, world.scoreRight, balls, poses = s
+	for (r, p) in zip(robots, poses):
+		set_pose(r, p)
+	world.objects = [Ball(Point(x, y)) for (x, y) in balls] + robots
+
+class RenderProcess:
+	"""
+	Owns the render process. robots is a list of (module name, robot name, role, pose) tuples, in the same order
+	the robots were added to the simulated world, and size is the size of its field (which may have been resumed
+	from a checkpoint, hence the current poses rather than those the roles imply).
+	"""
+	def __init__(self, robots, size=(900, 600)):
+		self.conn, child_conn = multiprocessing.Pipe()
+		self.process = multiprocessing.Process(target=_render_main, args=(child_conn, robots, size))
+		self.process.daemon = True
+		self.process.start()
+		self.ready = False		# Whether the render process is waiting for a snapshot
+		self.closed = False		# Set when the render process is gone (e.g. the window was closed)
+
+	def offer(self, world):
+		"Sends a snapshot of the world if the render process is idle. Never blocks. Returns True if the snapshot was sent."
+		if self.closed:
+			return False
+		try:
+			if not self.ready:
+				if not self.conn.poll():
+					return False
+				self.conn.recv()
+				self.ready = True
+			self.conn.send(snapshot(world))
+			self.ready = False
+			return True
+		except (EOFError, IOError):
+			self.closed = True
+			return False
+
+	def close(self):
+		if not self.closed:
+			try:
+				self.conn.send(None)
+			except (EOFError, IOError):
+				pass
+			self.closed = True
+		self.process.join(1)
+
+def _render_main(conn, robot_specs, size):
+	"Entry point of the render process"
+	import pygame
+	from pygame.locals import QUIT, KEYDOWN, K_ESCAPE
+	from world import World
+	from render import Renderer, SCREEN_SIZE, BACKGROUND_BLUE
+
+	world = World(size=size)
+	robots = []
+	for (module, name, role, p) in robot_specs:
+		r = __import__(module).Robot(world, name, role)
+		set_pose(r, p)
+		world.add_object(r)
+		robots.append(r)
+
+	pygame.init()
+	window = pygame.display.set_mode(SCREEN_SIZE)
+	pygame.display.set_caption('Robotex 2011 Simulator')
+	screen = pygame.display.get_surface()
+	renderer = Renderer(world, screen)
+
+	try:
+		conn.send(True)		# Ready for the first snapshot
+		while 1:
+			if conn.poll(0.01):
+				s = conn.recv()
+				if s is None:
+					break
+				apply_snapshot(world, robots, s)
+				screen.fill(BACKGROUND_BLUE)
+				renderer.draw()
+				pygame.display.flip()
+				conn.send(True)
+			for event in pygame.event.get():
+				if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+					return
+	except (EOFError, IOError):
+		pass	# The simulation process is gone
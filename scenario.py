@@ -0,0 +1,160 @@
+"""
+Scenario generator: ball placements for arenas of any size, with any number of balls.
+
+The balls are placed by Poisson-disk sampling (dart throwing on a spatial grid): a candidate drawn from the
+distribution is accepted only if no ball accepted so far is within min_dist of it, which the grid answers by
+looking at a few cells. So the balls never overlap, and tens of thousands of them are placed in seconds.
+Distributions:
+  uniform    - anywhere on the field
+  clustered  - around 16 random cluster centers
+  near-goal  - around the goals
+Like the standard placement in main.py, the balls stay out of the robots' starting corners and by default
+come in pairs mirrored through the center of the field (with a ball in the center if the count is odd).
+A scenario file is text: the field size on the first line, then the (x, y) of each ball, one per line.
+Usage:
+  python scenario.py --field 9000x6000 --balls 20001 --distribution clustered --seed 1 big.txt
+  python main.py --scenario big.txt telliskivi telliskivi
+"""
+import random
+from math import sqrt
+
+MARGIN = 10			# Distance of the balls from the walls
+CORNER = 60			# Size of the robots' starting corners
+DISTRIBUTIONS = ["uniform", "clustered", "near-goal"]
+
+class Grid:
+	"""
+	Points in square cells of side min_dist/sqrt(2), so that a cell holds at most one point
+	and the points within min_dist of any point are in the 5x5 cells around it.
+	>>> g = Grid(10)
+	>>> g.add((5, 5))
+	>>> (g.free((14, 5)), g.free((16, 5)))
+	(False, True)
+	"""
+	def __init__(self, min_dist):
+		self.min_dist2 = min_dist*min_dist
+		self.cell = min_dist/sqrt(2)
+		self.cells = {}
+
+	def free(self, p):
+		"Whether no point is within min_dist of p"
+		i, j = int(p[0]/self.cell), int(p[1]/self.cell)
+		for a in range(i - 2, i + 3):
+			for b in range(j - 2, j + 3):
+				q = self.cells.get((a, b))
+				if q is not None and (q[0] - p[0])**2 + (q[1] - p[1])**2 < self.min_dist2:
+					return False
+		return True
+
+	def add(self, p):
+		self.cells[(int(p[0]/self.cell), int(p[1]/self.cell))] = p
+
+def sampler(distribution, width, height, rng):
+	"Returns a function drawing a random point of the distribution (possibly outside the field)"
+	if distribution == "uniform":
+		return lambda: (rng.uniform(0, width), rng.uniform(0, height))
+	elif distribution == "clustered":
+		spread = min(width, height)/15.0
+		centers = [(rng.uniform(0, width), rng.uniform(0, height)) for i in range(16)]
+		def clustered():
+			c = rng.choice(centers)
+			return (rng.gauss(c[0], spread), rng.gauss(c[1], spread))
+		return clustered
+	elif distribution == "near-goal":
+		spread = min(width, height)/6.0
+		def near_goal():
+			x = abs(rng.gauss(0, spread))
+			return (x if rng.random() < 0.5 else width - x, rng.gauss(height/2.0, spread))
+		return near_goal
+	raise ValueError("Unknown distribution %s, use one of %s" % (distribution, ", ".join(DISTRIBUTIONS)))
+
+def allowed(p, width, height):
+	"Whether a ball may be placed at p: on the field, off the walls and out of the starting corners"
+	x, y = p
+	if x < MARGIN or x > width - MARGIN or y < MARGIN or y > height - MARGIN:
+		return False
+	return not ((x < CORNER and y < CORNER) or (x > width - CORNER and y > height - CORNER))
+
+def generate(width, height, count, distribution="uniform", mirror=True, seed=None, min_dist=10.6, attempts=1000):
+	"""
+	Returns the (x, y) of count balls, no two closer than min_dist (by default 2 pixels between two balls).
+	The global random generator is not used, so the same seed always gives the same scenario.
+	Raises ValueError if a ball cannot be placed in the given number of attempts, i.e. the field is too full.
+	>>> balls = generate(900, 600, 11, seed=1)
+	>>> (len(balls), balls[0], balls[1][0] + balls[2][0], balls[1][1] + balls[2][1])
+	(11, (450.0, 300.0), 900.0, 600.0)
+	>>> balls == generate(900, 600, 11, seed=1)
+	True
+	>>> balls = generate(900, 600, 2000, "clustered", mirror=False, seed=1)
+	>>> g, apart = Grid(10.6), True
+	>>> for b in balls:
+	...     apart = apart and g.free(b)
+	...     g.add(b)
+	>>> apart
+	True
+	>>> generate(100, 100, 1000, seed=1)
+	Traceback (most recent call last):
+	...
+	ValueError: Cannot place ball 16 of 1000 with min_dist 10.6, the field is too full
+	"""
+	rng = random.Random(seed)
+	draw = sampler(distribution, width, height, rng)
+	grid = Grid(min_dist)
+	balls = []
+	if mirror and count % 2 == 1:
+		balls.append((width/2.0, height/2.0))
+		grid.add(balls[0])
+	while len(balls) < count:
+		for i in range(attempts):
+			p = draw()
+			if not allowed(p, width, height) or not grid.free(p):
+				continue
+			if mirror:
+				q = (width - p[0], height - p[1])
+				if (q[0] - p[0])**2 + (q[1] - p[1])**2 < grid.min_dist2 or not grid.free(q):
+					continue
+				balls += [p, q]
+				grid.add(p)
+				grid.add(q)
+			else:
+				balls.append(p)
+				grid.add(p)
+			break
+		else:
+			raise ValueError("Cannot place ball %d of %d with min_dist %g, the field is too full" % (len(balls), count, min_dist))
+	return balls
+
+def save(path, size, balls):
+	f = open(path, "w")
+	f.write("%d %d\n" % size)
+	for (x, y) in balls:
+		f.write("%.3f %.3f\n" % (x, y))
+	f.close()
+
+def load(path):
+	"Reads a scenario file, returns ((width, height), [(x, y)])"
+	f = open(path)
+	try:
+		width, height = map(int, f.readline().split())
+		return ((width, height), [tuple(map(float, l.split())) for l in f if l.strip() != ""])
+	finally:
+		f.close()
+
+if __name__ == "__main__":
+	import sys, time
+	from optparse import OptionParser
+	parser = OptionParser(usage="python scenario.py [options] <scenario file>")
+	parser.add_option("--field", default="900x600", metavar="WxH", help="Size of the field in pixels (default: 900x600)")
+	parser.add_option("--balls", type="int", default=11, help="Number of balls (default: 11)")
+	parser.add_option("--distribution", default="uniform", help="One of %s (default: uniform)" % ", ".join(DISTRIBUTIONS))
+	parser.add_option("--no-mirror", action="store_true", default=False, help="Do not place the balls in mirrored pairs")
+	parser.add_option("--seed", type="int", help="Random seed")
+	(options, args) = parser.parse_args()
+	if len(args) != 1:
+		parser.print_usage()
+		sys.exit(1)
+	size = tuple(map(int, options.field.lower().split('x')))
+	t = time.time()
+	balls = generate(size[0], size[1], options.balls, options.distribution, not options.no_mirror, options.seed)
+	save(args[0], size, balls)
+	print "%d balls placed in %.2fs" % (len(balls), time.time() - t)
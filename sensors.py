@@ -0,0 +1,99 @@
+"""
+Batched sensor engine.
+
+Instead of letting every robot scan world.objects on each CAM/BEACON request, the engine
+computes the camera, beacon and goal readings of all robots against all balls in a single
+vectorized (NumPy) pass at the end of every simulation tick. Robots then simply look up
+their precomputed reading (see World.sensor_reading).
+
+NumPy is optional: if it is not installed, World silently falls back to the per-robot code.
+"""
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+class SensorReading:
+	"""
+	Noise-free sensor values of a single robot, all in robot coordinates (forward, left).
+	  camera    - (forward, left) of the closest ball in the camera triangle, or None
+	  beacon    - (forward, left, cos_angle) to the robot's beacon point
+	  beacon_en - (forward, left, cos_angle) to the opponent's beacon point
+	  goal      - (forward, left, visible) of the opponent's goal center
+	"""
+	def __init__(self, camera, beacon, beacon_en, goal):
+		self.camera = camera
+		self.beacon = beacon
+		self.beacon_en = beacon_en
+		self.goal = goal
+
+class SensorEngine:
+	"""
+	Computes sensor readings for all robots of a world at once.
+	A "robot" here is any world object which has the CAMERA_DEPTH, CAMERA_SIDE, forward, left,
+	beacon_point, beacon_point_en and goal_center attributes.
+	"""
+	def __init__(self, world):
+		if numpy is None:
+			raise ImportError("SensorEngine requires numpy")
+		self.world = world
+		self.readings = {}
+
+	def reading(self, robot):
+		"Returns the last computed SensorReading for the robot (None if it was not computed yet)"
+		return self.readings.get(id(robot))
+
+	def update(self):
+		"Recomputes the readings of all robots. Called by World.simulate once per tick."
+		objects = self.world.objects
+		robots = [o for o in objects if hasattr(o, 'CAMERA_DEPTH')]
+		if len(robots) == 0:
+			self.readings = {}
+			return
+		balls = self.world.ball_positions()
+
+		center = numpy.array([(r.center.x, r.center.y) for r in robots])
+		forward = numpy.array([(r.forward.x, r.forward.y) for r in robots])
+		left = numpy.array([(r.left.x, r.left.y) for r in robots])
+		depth = numpy.array([float(r.CAMERA_DEPTH) for r in robots])
+		ratio = numpy.array([float(r.CAMERA_SIDE)/r.CAMERA_DEPTH for r in robots])
+
+		# Camera: project every ball onto every robot's (forward, left) axes -> (robots x balls) matrices
+		if len(balls) > 0:
+			ball_pos = numpy.asarray(balls, dtype=float)
+			rel = ball_pos[numpy.newaxis, :, :] - center[:, numpy.newaxis, :]
+			b_forward = (rel * forward[:, numpy.newaxis, :]).sum(axis=2)
+			b_left = (rel * left[:, numpy.newaxis, :]).sum(axis=2)
+			visible = (b_forward > 0) & (b_forward < depth[:, numpy.newaxis]) & \
+					  (numpy.abs(b_left) < b_forward * ratio[:, numpy.newaxis])
+			closest = numpy.where(visible, b_forward, numpy.inf).argmin(axis=1)
+			seen = visible.any(axis=1)
+		else:
+			seen = numpy.zeros(len(robots), dtype=bool)
+
+		beacon = self._project(robots, 'beacon_point', center, forward, left)
+		beacon_en = self._project(robots, 'beacon_point_en', center, forward, left)
+		g_forward, g_left, _ = self._project(robots, 'goal_center', center, forward, left)
+		g_visible = (g_forward >= 1) & (numpy.abs(g_left) <= numpy.maximum(g_forward, 1) * ratio)
+
+		readings = {}
+		for i, r in enumerate(robots):
+			cam = None
+			if seen[i]:
+				j = closest[i]
+				cam = (float(b_forward[i, j]), float(b_left[i, j]))
+			readings[id(r)] = SensorReading(cam,
+								(float(beacon[0][i]), float(beacon[1][i]), float(beacon[2][i])),
+								(float(beacon_en[0][i]), float(beacon_en[1][i]), float(beacon_en[2][i])),
+								(float(g_forward[i]), float(g_left[i]), bool(g_visible[i])))
+		self.readings = readings	# Swap in one go, the server threads may be reading concurrently
+
+	def _project(self, robots, attr, center, forward, left):
+		"Returns (forward, left, cos_angle) arrays for the given target point attribute of each robot"
+		target = numpy.array([(getattr(r, attr).x, getattr(r, attr).y) for r in robots])
+		d = target - center
+		d_forward = (d * forward).sum(axis=1)
+		d_left = (d * left).sum(axis=1)
+		n = numpy.sqrt((d * d).sum(axis=1))
+		cos_angle = d_forward / numpy.where(n > 0, n, 1)
+		return (d_forward, d_left, cos_angle)
@@ -0,0 +1,111 @@
+"""
+Publishing of the world state into shared memory, for analysis and telemetry tools in other processes.
+This is a debugging aid which reveals the whole world, it is not meant for the robot controllers.
+
+The state is written into a memory-mapped file (put it on /dev/shm to keep it in memory) once per simulation step.
+Layout (little-endian):
+  offset 0   8s   magic "RBTXSHM1"
+  offset 8   Q    sequence counter: odd while the writer is updating, even when the data is consistent
+  offset 16  Q    tick
+  offset 24  i    score left
+  offset 28  i    score right
+  offset 32  I    number of balls
+  offset 36  I    number of robots
+  offset 40  I    ball capacity
+  offset 44  I    robot capacity
+  offset 64       balls:  ball capacity x 4 float64 (x, y, vx, vy)
+  then            robots: robot capacity x 6 float64 (x, y, forward x, forward y, left wheel speed, right wheel speed)
+Usage:
+  (simulator)  StatePublisher(world, "/dev/shm/robotex").attach()
+  (reader)     r = StateReader("/dev/shm/robotex")
+               tick, scores, balls, robots = r.read()   # consistent copy
+               r.balls, r.robots                        # live NumPy views, no copying
+"""
+import mmap, struct
+
+from world import Ball
+
+MAGIC = b"RBTXSHM1"
+HEADER = struct.Struct("<8sQQiiIIII")
+HEADER_SIZE = 64
+SEQ = struct.Struct("<Q")
+BALL_FIELDS = 4
+ROBOT_FIELDS = 6
+
+class StatePublisher:
+	"""
+	Writes the state of the world into the shared memory file on every simulation step (as a world task).
+	Balls beyond ball_capacity (by default twice the number of balls at the time of creation) are not published.
+	"""
+	def __init__(self, world, path, ball_capacity=None, robot_capacity=4):
+		self.world = world
+		if ball_capacity is None:
+			ball_capacity = max(16, 2*len([o for o in world.objects if isinstance(o, Ball)]))
+		self.ball_capacity = ball_capacity
+		self.robot_capacity = robot_capacity
+		self.robots_offset = HEADER_SIZE + ball_capacity*BALL_FIELDS*8
+		size = self.robots_offset + robot_capacity*ROBOT_FIELDS*8
+		f = open(path, "w+b")
+		f.truncate(size)
+		self.file = f
+		self.mm = mmap.mmap(f.fileno(), size)
+		self.seq = 0
+		HEADER.pack_into(self.mm, 0, MAGIC, 0, 0, 0, 0, 0, 0, ball_capacity, robot_capacity)
+
+	def attach(self):
+		"Starts publishing on every simulation step"
+		self.world.tasks.append(self.publish)
+
+	def publish(self):
+		w = self.world
+		balls = []
+		robots = []
+		for o in w.objects:
+			if isinstance(o, Ball):
+				if len(balls) < self.ball_capacity*BALL_FIELDS:
+					balls.extend((o.center.x, o.center.y, o.v.x, o.v.y))
+			elif len(robots) < self.robot_capacity*ROBOT_FIELDS:
+				robots.extend((o.center.x, o.center.y, o.forward.x, o.forward.y,
+							   getattr(o, 'leftSpeed', 0), getattr(o, 'rightSpeed', 0)))
+		# Seqlock: readers retry if the counter is odd or has changed while they were reading
+		self.seq += 1
+		SEQ.pack_into(self.mm, 8, self.seq)
+		HEADER.pack_into(self.mm, 0, MAGIC, self.seq, w.tick, w.scoreLeft, w.scoreRight,
+						 len(balls)//BALL_FIELDS, len(robots)//ROBOT_FIELDS, self.ball_capacity, self.robot_capacity)
+		struct.pack_into("<%dd" % len(balls), self.mm, HEADER_SIZE, *balls)
+		struct.pack_into("<%dd" % len(robots), self.mm, self.robots_offset, *robots)
+		self.seq += 1
+		SEQ.pack_into(self.mm, 8, self.seq)
+		return True		# Keep running as a world task
+
+class StateReader:
+	"""
+	Maps the shared memory file of a StatePublisher. Requires numpy.
+	balls and robots are NumPy views of the whole capacity (use the counts from read() or header()).
+	"""
+	def __init__(self, path):
+		import numpy
+		self.file = open(path, "rb")
+		self.mm = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+		h = HEADER.unpack_from(self.mm, 0)
+		if h[0] != MAGIC:
+			raise ValueError("%s is not a world state file" % path)
+		ball_capacity, robot_capacity = h[7], h[8]
+		self.balls = numpy.frombuffer(self.mm, numpy.float64, ball_capacity*BALL_FIELDS, HEADER_SIZE).reshape((ball_capacity, BALL_FIELDS))
+		self.robots = numpy.frombuffer(self.mm, numpy.float64, robot_capacity*ROBOT_FIELDS,
+									   HEADER_SIZE + ball_capacity*BALL_FIELDS*8).reshape((robot_capacity, ROBOT_FIELDS))
+
+	def header(self):
+		"Returns (sequence counter, tick, score left, score right, number of balls, number of robots)"
+		return HEADER.unpack_from(self.mm, 0)[1:7]
+
+	def read(self):
+		"Returns a consistent copy: (tick, (score left, score right), balls array, robots array)"
+		while 1:
+			seq, tick, left, right, nb, nr = self.header()
+			if seq % 2 == 1:
+				continue
+			balls = self.balls[:nb].copy()
+			robots = self.robots[:nr].copy()
+			if SEQ.unpack_from(self.mm, 8)[0] == seq:
+				return (tick, (left, right), balls, robots)
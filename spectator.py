@@ -0,0 +1,147 @@
+"""
+Spectator broadcast: compact world state frames for any number of remote viewers and dashboards.
+
+Every few simulation steps the state of the world is encoded once into a binary frame and handed to every
+subscriber's bounded queue. Each subscriber has its own sender thread; when a subscriber is too slow to keep up,
+its oldest frames are dropped, so neither the simulation nor the other subscribers are ever held up.
+Frame layout (little-endian), see encode_frame:
+  I    length of the rest of the frame in bytes
+  Q    tick
+  i i  score left, score right
+  I I  number of balls, number of robots
+  then balls x 2 float32 (x, y) and robots x 4 float32 (x, y, forward x, forward y)
+Usage:
+  (simulator)  SpectatorServer(world, port=5090, every=40).serve()
+  (viewer)     for (tick, scores, balls, robots) in read_frames("localhost", 5090): ...
+"""
+import thread, traceback, struct, Queue
+
+from renderproc import snapshot
+
+LENGTH = struct.Struct("<I")
+HEADER = struct.Struct("<QiiII")
+
+def encode_frame(s):
+	"""
+	Encodes a renderproc.snapshot into a frame.
+	>>> f = encode_frame((1234, 1, 0, [(10.0, 20.0)], [(38.0, 38.0, 1.0, 0.0)]))
+	>>> len(f)
+	52
+	>>> decode_frame(f[4:])
+	(1234, (1, 0), [(10.0, 20.0)], [(38.0, 38.0, 1.0, 0.0)])
+	>>> len(decode_frame(encode_frame((0, 0, 0, [(1.0, 2.0)]*100000, []))[4:])[2])
+	100000
+	"""
+	tick, left, right, balls, robots = s
+	values = [v for b in balls for v in b] + [v for r in robots for v in r]
+	body = HEADER.pack(tick, left, right, len(balls), len(robots)) + struct.pack("<%df" % len(values), *values)
+	return LENGTH.pack(len(body)) + body
+
+def decode_frame(body):
+	"Decodes a frame (without its length prefix) into (tick, (score left, score right), [(x, y)], [(x, y, fx, fy)])"
+	tick, left, right, nb, nr = HEADER.unpack_from(body, 0)
+	values = struct.unpack_from("<%df" % (2*nb + 4*nr), body, HEADER.size)
+	balls = [values[2*i:2*i + 2] for i in range(nb)]
+	robots = [values[2*nb + 4*i:2*nb + 4*i + 4] for i in range(nr)]
+	return (tick, (left, right), balls, robots)
+
+def read_frames(host, port):
+	"Connects to a SpectatorServer and yields the decoded frames"
+	import socket
+	s = socket.create_connection((host, port))
+	buffered = ""
+	while 1:
+		data = s.recv(65536)
+		if not data:
+			return
+		buffered += data
+		while len(buffered) >= LENGTH.size:
+			n = LENGTH.unpack_from(buffered, 0)[0]
+			if len(buffered) < LENGTH.size + n:
+				break
+			yield decode_frame(buffered[LENGTH.size:LENGTH.size + n])
+			buffered = buffered[LENGTH.size + n:]
+
+class Subscriber:
+	"A connected spectator: a bounded queue of frames and a thread sending them"
+	def __init__(self, conn, queue_size):
+		self.conn = conn
+		self.queue = Queue.Queue(queue_size)
+		self.dropped = 0
+		self.closed = False
+
+	def offer(self, frame):
+		"Queues a frame, dropping the oldest one if the queue is full. Never blocks."
+		while 1:
+			try:
+				self.queue.put_nowait(frame)
+				return
+			except Queue.Full:
+				try:
+					self.queue.get_nowait()
+					self.dropped += 1
+				except Queue.Empty:
+					pass
+
+	def _sender_thread(self):
+		try:
+			while 1:
+				# Send whatever has queued up in one go, fewer wakeups for the simulation to compete with
+				frames = [self.queue.get()]
+				while 1:
+					try:
+						frames.append(self.queue.get_nowait())
+					except Queue.Empty:
+						break
+				self.conn.sendall("".join(frames))
+		except:
+			pass	# The spectator went away
+		self.closed = True
+		self.conn.close()
+
+class SpectatorServer:
+	"""
+	Broadcasts a frame every `every` simulation steps (40 = 25 frames per simulated second) to all subscribers.
+	Frames are produced by a world task, so the simulation pays for one snapshot per frame, however many subscribers there are.
+	Usage:
+	  SpectatorServer(world, port=5090).serve()
+	"""
+	def __init__(self, world, port=5090, every=40, queue_size=8):
+		self.world = world
+		self.port = port
+		self.every = every
+		self.queue_size = queue_size
+		self.subscribers = []
+	def serve(self):
+		"""Starts accepting subscribers in a separate thread and broadcasting on every simulation step"""
+		self.world.tasks.append(self.broadcast)
+		thread.start_new_thread(self._server_thread, tuple())
+	def broadcast(self):
+		if self.world.tick % self.every == 0 and len(self.subscribers) > 0:
+			try:
+				frame = encode_frame(snapshot(self.world))
+			except:
+				traceback.print_exc()	# A broken frame must not stop the simulation, the spectators just miss it
+				return True
+			for s in self.subscribers[:]:
+				if s.closed:
+					self.subscribers.remove(s)
+				else:
+					s.offer(frame)
+		return True		# Keep running as a world task
+	def _server_thread(self):
+		import socket
+		s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+		s.bind(('', self.port))
+		s.listen(32)
+		print "Spectators may connect at port %d" % self.port
+		while 1:
+			try:
+				conn, addr = s.accept()
+				conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+				sub = Subscriber(conn, self.queue_size)
+				thread.start_new_thread(sub._sender_thread, tuple())
+				self.subscribers.append(sub)
+			except:
+				traceback.print_exc()
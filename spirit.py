@@ -1,11 +1,10 @@
 # Tegemist on Team Spiriti modifitseeritud roboti failiga
 # Selles failis ei sisaldu classi RobotServer()
 
-import 	pygame, random, thread, traceback
-from 	pygame.locals 	import *
-from 	pygame 			import draw
+import 	random, thread, traceback, copy
 from 	math 			import sin, cos, sqrt
 from 	world 			import Point, Wall, WorldObject, Ball
+import 	telliskivi
 
 class Robot(WorldObject):
 	# Robot must fit into a 350mm cylinder, which here means that it should not exceed a square of 49x49 pixels more or less. Hence the width/height parameters.
@@ -15,6 +14,7 @@ class Robot(WorldObject):
 		center 					= Point(int(12+height/2), int(12+width/2)) if role == "TOPLEFT" else Point(world.width-(12+height/2), world.height-(12+width/2))
 		
 		WorldObject.__init__(self, center, int(sqrt(width**2 + height**2)/2) )
+		self.bounding_radius = sqrt(width**2 + height**2)/2	# The radius above is rounded down and cuts off the corners
 		self.world = world
 		self.name = name
 		self.wr = width/2
@@ -47,8 +47,20 @@ class Robot(WorldObject):
 		# Whether there's a ball in the grabber
 		self.grabbed_ball = None
 		self.grabbed_ball_lock = thread.allocate_lock()
+
+		# Whether other balls and robots block the camera's view (see occlusion.py)
+		self.camera_occlusion = False
+
+		# The starting pose, see reset
+		self.start = (Point(self.center.x, self.center.y), Point(self.forward.x, self.forward.y))
+
+		# The robot's own random generator for the wheel and sensor noise, used in the simulation thread only (see noise).
+		# It is seeded from the global one, which main.py and World.reset seed with the match seed.
+		self.random = random.Random(random.getrandbits(32))
+		self.noise_seed = self.random.getrandbits(32)
 		
 	def draw(self, screen):
+		from pygame import draw
 		# Center point
 		draw.line(screen, (0,0,0), (self.center - self.left*5).as_tuple(), (self.center + self.left*5).as_tuple())
 		draw.line(screen, (0,0,0), self.center.as_tuple(), (self.center + self.forward*8).as_tuple())
@@ -81,8 +93,42 @@ class Robot(WorldObject):
 	def rotate(self, angle):
 		self.forward.rotate(angle)
 		self.left.rotate(angle)
+	
+	def reset(self):
+		"Puts the robot back to its starting pose, stopped and without a ball, for a new match (see World.reset)"
+		with self.data_lock:
+			self.center = Point(self.start[0].x, self.start[0].y)
+			self.forward = Point(self.start[1].x, self.start[1].y)
+			self.left = Point(-self.forward.y, self.forward.x)
+			self.leftSpeed = 0
+			self.rightSpeed = 0
+		self.grabbed_ball = None
+		self.random.seed(random.getrandbits(32))
+
+	def fork(self, world):
+		"Returns a copy of the robot's physical state living in a forked world (see World.fork)"
+		r = copy.copy(self)		# Dimensions, sensor parameters and wheel speeds
+		r.world = world
+		r.center = Point(self.center.x, self.center.y)
+		r.forward = Point(self.forward.x, self.forward.y)
+		r.left = Point(self.left.x, self.left.y)
+		r.data_lock = thread.allocate_lock()
+		r.grabbed_ball_lock = thread.allocate_lock()
+		r.random = random.Random()
+		r.random.setstate(self.random.getstate())
+		if self.grabbed_ball is not None:
+			r.grabbed_ball = world.forked(self.grabbed_ball)
+		return r
+
+	def noise(self):
+		"""
+		The random generator of the sensor noise in this tick. It is seeded in the simulation thread (see simulate), so the
+		readings do not depend on the order in which the robot servers handle their commands (as in lockstep, say).
+		"""
+		return self.world.once_per_tick((self, 'noise'), lambda: random.Random(self.noise_seed))
 		
 	def simulate(self):
+		self.noise_seed = self.random.getrandbits(32)
 		# This is a hack which only works at small simulation steps
 		leftTurn = (self.leftSpeed - self.rightSpeed)/self.wr/2
 		forwardMove = (self.leftSpeed + self.rightSpeed)/2
@@ -98,6 +144,7 @@ class Robot(WorldObject):
 		with self.grabbed_ball_lock:
 			if self.grabbed_ball is not None:
 				self.grabbed_ball.v = Point(0,0)
+				self.grabbed_ball.wake()
 				self.grabbed_ball.center = self.center + self.forward*self.grabbed_forward + self.left*self.grabbed_left
 	
 		# Precompute "edge walls", those will be useful in collision checks
@@ -111,6 +158,7 @@ class Robot(WorldObject):
 		if (m < 0):
 			# We need to nudge perpendicular to the wall by distance -m
 			self.center.add(w.normal*(-m))
+			return True
 	
 	def collision_check(self, obj):
 		# If it is not a ball, ignore it
@@ -121,12 +169,13 @@ class Robot(WorldObject):
 			if (dist < obj.radius + self.radius):
 				# Nudge either us or them, choose randomly to avoid some ugliness
 				dir_normalized = dir * (1/dist)
-				if (random.randint(0,1) == 0):
+				if (self.random.randint(0,1) == 0):
 					# Them
 					obj.center.add(dir_normalized*(obj.radius + self.radius - dist))
 				else:
 					# Us
 					self.center.add(dir_normalized*(dist - (obj.radius + self.radius)))
+				return True
 		else: #objekt on pall
 			# Find which wall is the ball touching
 			for w in self.edge_walls:
@@ -145,14 +194,17 @@ class Robot(WorldObject):
 							with self.grabbed_ball_lock:
 								self.grabbed_ball = obj
 								obj.v = Point(0, 0)
+								obj.wake()
 								self.grabbed_forward = v_forward - 5
 								self.grabbed_left = v_left
-							return
+							self.world.log_event("grab", self, obj)
+							return False		# Logged as a grab, not as a collision
 						else: #kui pole esimene ots	
 							# First, nudge
 							obj.center.add(w.normal * (-d))
 							# Second, simulate a rebounce (this is a hack, but it's way easier than considering rotations and stuff)
 							obj.v.add(w.normal * (-d*2))
+							return True
 
 	# ----------- The following are the main commands for the robot -----------------
 	
@@ -181,11 +233,19 @@ class Robot(WorldObject):
 						with self.grabbed_ball_lock:
 							self.grabbed_ball = b
 							b.v = Point(0, 0)
+							b.wake()
 							self.grabbed_forward = v_forward - 5
 							self.grabbed_left = v_left
+						self.world.log_event("grab", self, b)
 						return
 	def beacon(self):
 		"Returns true if cos(angle) to beacon is > 0.99"
+		return self.world.once_per_tick((self, 'beacon'), self._beacon)
+	
+	def _beacon(self):
+		r = self.world.sensor_reading(self)
+		if r is not None:
+			return r.beacon[2] > 0.994
 		dbeacon = self.beacon_point - self.center
 		dbeacon.normalize()
 		#originaalis oli 0.99 mis vastab 8.1 kraadile meie kasutame 0.995 mis vastab 5.7le, 993-6.7kraadi
@@ -197,10 +257,34 @@ class Robot(WorldObject):
 				self.grabbed_ball.center = self.center + self.forward*(self.grabbed_forward + 10) + self.left*self.grabbed_left
 				# Shoots the ball at 0.4 pixels per millisecond (2.0 m/s)
 				self.grabbed_ball.v = self.forward * 1	## oli 0.4 mis vastab 2 ms, paneme 2 mis vastab 10m/s 
+				self.grabbed_ball.wake()
+				self.world.log_event("shoot", self, self.grabbed_ball)
 				self.grabbed_ball = None
 	def camera(self):
 		"This is the 'camera' sensor. If any ball is found in the 'camera triangle', the distance and bearing to it are reported (with a random 10% noise)"
 		"If several balls are found, one of them is reported (typically it is a stable solution)"
+		c = self.world.once_per_tick((self, 'camera'), self._closest_ball)
+		if c is None:
+			return None
+		n = self.noise()
+		return (c[0]*n.uniform(0.9,1.1), c[1]*n.uniform(0.9,1.1))
+	
+	def camera_all(self):
+		"All the balls in the 'camera triangle' (as in camera), nearest first. With camera_occlusion the hidden ones are left out."
+		from occlusion import visible_balls
+		balls = self.world.once_per_tick((self, 'camera_all'), lambda: visible_balls(self, self.world.objects, self.camera_occlusion))
+		n = self.noise()
+		return [(f*n.uniform(0.9,1.1), l*n.uniform(0.9,1.1)) for (f, l) in balls]
+	
+	def _closest_ball(self):
+		"Noise-free (forward, left) of the closest ball in the camera triangle, or None"
+		if self.camera_occlusion:
+			from occlusion import visible_balls
+			balls = visible_balls(self, self.world.objects)
+			return min(balls) if len(balls) > 0 else None
+		r = self.world.sensor_reading(self)
+		if r is not None:
+			return r.camera
 		v_forward_closest 	= 5000;
 		v_left_closest 		= 5000;
 		for b in self.world.objects:
@@ -218,7 +302,7 @@ class Robot(WorldObject):
 												v_forward_closest 	= v_forward
 												v_left_closest 		= v_left
 		if (v_forward_closest != 5000):
-			return (v_forward_closest*random.uniform(0.9,1.1), v_left_closest*random.uniform(0.9,1.1))
+			return (v_forward_closest, v_left_closest)
 		return None
 
 	def optokatkesti(self):
@@ -226,46 +310,12 @@ class Robot(WorldObject):
 		if self.grabbed_ball is not None: #Pall on haaratud
 			return 1
 
-class RobotServer:
+class RobotServer(telliskivi.RobotServer):
 	"""
-	This is the robot's network controller interface. It accepts commands over TCP and forwards them to the robot.
-	Usage:
-	  r = Robot( ... ) # create the robot instance
-	  s = RobotServer(r, port=5000) # create the robot server
-	  s.serve()		   # starts a new thread with the server. The thread runs forever.
+	This is the robot's network controller interface. The networking is the same as telliskivi.RobotServer,
+	only the replies differ (CAM answers 0 0 when no ball is seen, BEACON answers 1/0 and there is an OPTO command).
 	"""
-	def __init__(self, robot, port=5000):
-		self.robot = robot
-		self.port = port
-	def serve(self):
-		"""Starts the server in a separate thread"""
-		import thread
-		thread.start_new_thread(self._server_thread, tuple())
-	def _server_thread(self):
-		# Echo server program
-		print "Starting server at port %d" % self.port
-		import socket
-		
-		HOST = ''       # Symbolic name meaning all available interfaces
-		s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-		s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)	#Vabastamine pordi
-		s.bind((HOST, self.port))
-		s.listen(1)
-		print "Robot %s listening at port %d" % (self.robot.name, self.port)
-		while 1:
-			try:
-				conn, addr = s.accept()
-				print 'Connected by', addr
-				while 1:
-					data = conn.recv(1024)
-					if not data: break
-					#print "%s<< %s" % (self.robot.name, data.strip())
-					response = self._process_command(data)
-					#print "%s>> %s" % (self.robot.name, response.strip())
-					conn.send(response + "\n")
-				conn.close()
-			except:
-				traceback.print_exc()
+	REUSE_ADDRESS = True	#Vabastamine pordi
 	
 	def _process_command(self, cmd):
 		"Reaction to each command"
@@ -275,11 +325,10 @@ class RobotServer:
 				l,r = int(c[1]), int(c[2])
 				if (l < -100 or l > 100 or r < -100 or r > 100):
 					return "ERROR"
-				# Introduce up to 10% error in settings
-				ltrue = l*random.uniform(0.9, 1.1)
-				rtrue = r*random.uniform(0.9, 1.1)
-				self.robot.wheels(ltrue, rtrue)
-				return "OK"
+				return str(self.actuation.put("WHEELS", l, r))
+			elif c[0] == "CAM" and len(c) > 1 and c[1] == "ALL":
+				balls = self.robot.camera_all()
+				return " ".join([str(len(balls))] + ["%f %f" % b for b in balls])
 			elif c[0] == "CAM":
 				c = self.robot.camera()
 				if c is None:
@@ -287,15 +336,23 @@ class RobotServer:
 				else:
 					return "%f %f" % c
 			elif c[0] == "GRAB":
-				self.robot.grab()
-				return "OK"
+				return str(self.actuation.put("GRAB"))
 			elif c[0] == "SHOOT":
-				self.robot.shoot()
-				return "OK"
+				return str(self.actuation.put("SHOOT"))
 			elif c[0] == "BEACON":
 				return "1" if self.robot.beacon() else "0"
 			elif c[0] == "OPTO":			#Lisatud optokatkesti
 				return "1" if self.robot.optokatkesti() else "0"			
+			elif c[0] == "BEHAVIOR":
+				return self._run_behaviour(cmd.split(None, 1)[1])
+			elif c[0] == "STEP":
+				return str(self._step(int(c[1]) if len(c) > 1 else 1))
+			elif c[0] == "TICK":
+				return str(self.robot.world.tick)
+			elif c[0] == "RESET":
+				return self._reset(int(c[1]) if len(c) > 1 else None)
+			elif c[0] == "MATCH":
+				return str(self.robot.world.match)
 			else:
 				return "ERROR: else"
 		except:
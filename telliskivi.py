@@ -1,6 +1,4 @@
-import pygame,random,thread,traceback
-from pygame.locals import *
-from pygame import draw
+import random,thread,traceback,copy,time
 from math import sin, cos, sqrt, atan2
 import thread
 
@@ -47,8 +45,20 @@ class Robot(WorldObject):
 		# Whether there's a ball in the grabber
 		self.grabbed_ball = None
 		self.grabbed_ball_lock = thread.allocate_lock()
+
+		# Whether other balls and robots block the camera's view (see occlusion.py)
+		self.camera_occlusion = False
+
+		# The starting pose, see reset
+		self.start = (Point(self.center.x, self.center.y), Point(self.forward.x, self.forward.y))
+
+		# The robot's own random generator for the wheel and sensor noise, used in the simulation thread only (see noise).
+		# It is seeded from the global one, which main.py and World.reset seed with the match seed.
+		self.random = random.Random(random.getrandbits(32))
+		self.noise_seed = self.random.getrandbits(32)
 		
 	def draw(self, screen):
+		from pygame import draw, Rect
 		# Center point
 		draw.line(screen, (0,0,0), (self.center - self.left*5).as_tuple(), (self.center + self.left*5).as_tuple())
 		draw.line(screen, (0,0,0), self.center.as_tuple(), (self.center + self.forward*8).as_tuple())
@@ -83,8 +93,42 @@ class Robot(WorldObject):
 	def rotate(self, angle):
 		self.forward.rotate(angle)
 		self.left.rotate(angle)
+	
+	def reset(self):
+		"Puts the robot back to its starting pose, stopped and without a ball, for a new match (see World.reset)"
+		with self.data_lock:
+			self.center = Point(self.start[0].x, self.start[0].y)
+			self.forward = Point(self.start[1].x, self.start[1].y)
+			self.left = Point(-self.forward.y, self.forward.x)
+			self.leftSpeed = 0
+			self.rightSpeed = 0
+		self.grabbed_ball = None
+		self.random.seed(random.getrandbits(32))
+
+	def fork(self, world):
+		"Returns a copy of the robot's physical state living in a forked world (see World.fork)"
+		r = copy.copy(self)		# Dimensions, sensor parameters and wheel speeds
+		r.world = world
+		r.center = Point(self.center.x, self.center.y)
+		r.forward = Point(self.forward.x, self.forward.y)
+		r.left = Point(self.left.x, self.left.y)
+		r.data_lock = thread.allocate_lock()
+		r.grabbed_ball_lock = thread.allocate_lock()
+		r.random = random.Random()
+		r.random.setstate(self.random.getstate())
+		if self.grabbed_ball is not None:
+			r.grabbed_ball = world.forked(self.grabbed_ball)
+		return r
+
+	def noise(self):
+		"""
+		The random generator of the sensor noise in this tick. It is seeded in the simulation thread (see simulate), so the
+		readings do not depend on the order in which the robot servers handle their commands (as in lockstep, say).
+		"""
+		return self.world.once_per_tick((self, 'noise'), lambda: random.Random(self.noise_seed))
 		
 	def simulate(self):
+		self.noise_seed = self.random.getrandbits(32)
 		# This is a hack which only works at small simulation steps
 		leftTurn = (self.leftSpeed - self.rightSpeed)/self.WHEEL_RADIUS/2
 		forwardMove = (self.leftSpeed + self.rightSpeed)/2
@@ -100,6 +144,7 @@ class Robot(WorldObject):
 		with self.grabbed_ball_lock:
 			if self.grabbed_ball is not None:
 				self.grabbed_ball.v = Point(0,0)
+				self.grabbed_ball.wake()
 				self.grabbed_ball.center = self.center + self.forward*self.grabbed_forward + self.left*self.grabbed_left
 	
 		# Precompute "edge walls", those will be useful in collision checks
@@ -113,6 +158,7 @@ class Robot(WorldObject):
 		if (m < 0):
 			# We need to nudge perpendicular to the wall by distance -m
 			self.center.add(w.normal*(-m))
+			return True
 	
 	def collision_check(self, obj):
 		# If it is not a ball, ignore it
@@ -123,12 +169,13 @@ class Robot(WorldObject):
 			if (dist < obj.radius + self.radius):
 				# Nudge either us or them, choose randomly to avoid some ugliness
 				dir_normalized = dir * (1/dist)
-				if (random.randint(0,1) == 0):
+				if (self.random.randint(0,1) == 0):
 					# Them
 					obj.center.add(dir_normalized*(obj.radius + self.radius - dist))
 				else:
 					# Us
 					self.center.add(dir_normalized*(dist - (obj.radius + self.radius)))
+				return True
 		else:
 			# First see whether the ball is within the radius
 			dir = obj.center - self.center
@@ -142,7 +189,7 @@ class Robot(WorldObject):
 				dir.normalize()
 				obj.center.add(dir * (-d))
 				obj.v.add(dir * (-d*2))
-				return
+				return True
 			# The ball might be touching the front edge, check it
 			d = front_coord - self.FORWARD_EDGE_FRONT - obj.radius
 			if (d < 0):
@@ -152,6 +199,7 @@ class Robot(WorldObject):
 					obj.center.add(self.forward * (-d))
 					# Second, simulate a rebounce (this is a hack, but it's way easier than considering rotations and stuff)
 					obj.v.add(self.forward * (-d*2))
+					return True
 
 	# ----------- The following are the main commands for the robot -----------------
 	
@@ -181,12 +229,26 @@ class Robot(WorldObject):
 						with self.grabbed_ball_lock:
 							self.grabbed_ball = b
 							b.v = Point(0, 0)
+							b.wake()
 							self.grabbed_forward = v_forward - 5
 							self.grabbed_left = v_left
+						self.world.log_event("grab", self, b)
 						return
 	
 	def beacon(self):
 		"Returns true if cos(angle) to beacon is > 0.99"
+		return self.world.once_per_tick((self, 'beacon'), self._beacon)
+	
+	def _beacon(self):
+		r = self.world.sensor_reading(self)
+		if r is not None:
+			dbeacon_forward, dbeacon_left, cos_beacon = r.beacon
+			dbeacon_en_forward, dbeacon_en_left, cos_beacon_en = r.beacon_en
+			if cos_beacon < 0.9:
+				dbeacon_forward, dbeacon_left = 5000, 500
+			if cos_beacon_en < 0.9:
+				dbeacon_en_forward, dbeacon_en_left = 5000, 500
+			return [dbeacon_forward, dbeacon_left, dbeacon_en_forward, dbeacon_en_left]
 		dbeacon = self.beacon_point - self.center
 		dbeacon_forward = self.forward.inner_product(dbeacon)
 		dbeacon_left = self.left.inner_product(dbeacon)
@@ -205,6 +267,13 @@ class Robot(WorldObject):
 
 	def goal(self):
 		"Returns the location of the goal, in robot coordinates, if it is visible. Otherwise returns 0 0"
+		return self.world.once_per_tick((self, 'goal'), self._goal)
+	
+	def _goal(self):
+		r = self.world.sensor_reading(self)
+		if r is not None:
+			goal_dist, goal_left, visible = r.goal
+			return (goal_dist, goal_left) if visible else (0, 0)
 		dgoal = self.goal_center - self.center
 		goal_dist  = dgoal.inner_product(self.forward)
 		goal_left  = dgoal.inner_product(self.left)
@@ -222,11 +291,35 @@ class Robot(WorldObject):
 				self.grabbed_ball.center = self.center + self.forward*(self.grabbed_forward + 10) + self.left*self.grabbed_left
 				# Shoots the ball at 0.4 pixels per millisecond (2.0 m/s)
 				self.grabbed_ball.v = self.forward * 0.4	
+				self.grabbed_ball.wake()
+				self.world.log_event("shoot", self, self.grabbed_ball)
 				self.grabbed_ball = None
 	
 	def camera(self):
 		"This is the 'camera' sensor. If any ball is found in the 'camera triangle', the distance and bearing to it are reported (with a random 10% noise)"
 		"If several balls are found, the closest is reported"
+		c = self.world.once_per_tick((self, 'camera'), self._closest_ball)
+		if c is None:
+			return None
+		n = self.noise()
+		return (c[0]*n.uniform(0.9,1.1), c[1]*n.uniform(0.9,1.1))
+	
+	def camera_all(self):
+		"All the balls in the 'camera triangle' (as in camera), nearest first. With camera_occlusion the hidden ones are left out."
+		from occlusion import visible_balls
+		balls = self.world.once_per_tick((self, 'camera_all'), lambda: visible_balls(self, self.world.objects, self.camera_occlusion))
+		n = self.noise()
+		return [(f*n.uniform(0.9,1.1), l*n.uniform(0.9,1.1)) for (f, l) in balls]
+	
+	def _closest_ball(self):
+		"Noise-free (forward, left) of the closest ball in the camera triangle, or None"
+		if self.camera_occlusion:
+			from occlusion import visible_balls
+			balls = visible_balls(self, self.world.objects)
+			return min(balls) if len(balls) > 0 else None
+		r = self.world.sensor_reading(self)
+		if r is not None:
+			return r.camera
 		v_forward_closest = 5000;
 		v_left_closest = 5000;
 		for b in self.world.objects:
@@ -244,24 +337,54 @@ class Robot(WorldObject):
 												v_forward_closest = v_forward
 												v_left_closest = v_left
 		if (v_forward_closest != 5000):
-			return (v_forward_closest*random.uniform(0.9,1.1), v_left_closest*random.uniform(0.9,1.1))
+			return (v_forward_closest, v_left_closest)
 		return None
 
 		
+def split_commands(buffered, data, framed=False):
+	r"""
+	Splits received data into complete command lines. Returns (commands, incomplete rest of the last line).
+	Commands are terminated by a newline, but older clients send a single command per packet
+	without the terminator, hence such a packet is taken as a complete command, unless the connection
+	is framed, i.e. has already sent a newline: then a line split over several packets is put together.
+	>>> split_commands("", "CAM")
+	(['CAM'], '')
+	>>> split_commands("", "CAM\nWHEELS 10 10\nBEA")
+	(['CAM', 'WHEELS 10 10'], 'BEA')
+	>>> split_commands("BEA", "CON\n")
+	(['BEACON'], '')
+	>>> split_commands("", "WHEE", framed=True)
+	([], 'WHEE')
+	>>> split_commands("WHEE", "LS 10 10\n", framed=True)
+	(['WHEELS 10 10'], '')
+	"""
+	if not framed and buffered == "" and "\n" not in data:
+		return ([data], "")
+	lines = (buffered + data).split("\n")
+	rest = lines.pop()
+	return ([l for l in lines if l.strip() != ""], rest)
+
 class RobotServer:
 	"""
 	This is the robot's network controller interface. It accepts commands over TCP and forwards them to the robot.
+	Each command is a line of text and gets a line of reply. Several commands may be sent at once, the replies come in the same order.
 	Usage:
 	  r = Robot( ... ) # create the robot instance
 	  s = RobotServer(r, port=5000) # create the robot server
 	  s.serve()		   # starts a new thread with the server. The thread runs forever.
 	"""
+	REUSE_ADDRESS = True	# Whether to set SO_REUSEADDR on the listening socket (so that a restarted simulator can bind at once)
+	
 	def __init__(self, robot, port=5000):
+		from actuation import queue_of
 		self.robot = robot
 		self.port = port
+		self.actuation = queue_of(robot)	# WHEELS, GRAB and SHOOT are applied at the start of a step, see actuation.py
+		self.actuation.actions.update(WHEELS=self._wheels, GRAB=robot.grab, SHOOT=robot.shoot)
 	def serve(self):
 		"""Starts the server in a separate thread"""
 		import thread
+		self.actuation.attach()
 		thread.start_new_thread(self._server_thread, tuple())
 	def _server_thread(self):
 		# Echo server program
@@ -270,24 +393,100 @@ class RobotServer:
 		
 		HOST = ''       # Symbolic name meaning all available interfaces
 		s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+		if self.REUSE_ADDRESS:
+			s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
 		s.bind((HOST, self.port))
 		s.listen(1)
 		print "Robot %s listening at port %d" % (self.robot.name, self.port)
 		while 1:
 			try:
 				conn, addr = s.accept()
+				conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 				print 'Connected by', addr
-				while 1:
-					data = conn.recv(1024)
-					if not data: break
-					#print "%s<< %s" % (self.robot.name, data.strip())
-					response = self._process_command(data)
-					#print "%s>> %s" % (self.robot.name, response.strip())
-					conn.send(response + "\n")
-				conn.close()
+				metrics = getattr(self.robot.world, 'metrics', None)
+				if metrics is not None:
+					metrics.connected(1)
+				try:
+					self._serve_connection(conn, metrics)
+				finally:
+					if metrics is not None:
+						metrics.connected(-1)
+					if self.robot.world.lockstep is not None:
+						self.robot.world.lockstep.leave(self)
+					conn.close()
 			except:
 				traceback.print_exc()
 	
+	def _serve_connection(self, conn, metrics):
+		buffered = ""
+		framed = False		# Whether the client terminates its commands with newlines, see split_commands
+		while 1:
+			data = conn.recv(4096)
+			if not data: break
+			commands, buffered = split_commands(buffered, data, framed)
+			framed = framed or "\n" in data
+			#print "%s<< %s" % (self.robot.name, commands)
+			responses = []
+			for c in commands:
+				if metrics is not None:
+					t = time.time()
+					responses.append(self._process_command(c))
+					metrics.command(self.robot.name, (c.split() or [""])[0], time.time() - t)
+				else:
+					responses.append(self._process_command(c))
+				if self.robot.world.events is not None:
+					parts = c.split(None, 1) + ["", ""]
+					self.robot.world.log_event("command", self.robot, name=parts[0], args=parts[1].strip(), reply=responses[-1])
+			#print "%s>> %s" % (self.robot.name, responses)
+			if len(responses) > 0:
+				conn.sendall("".join([r + "\n" for r in responses]))
+	
+	def _run_behaviour(self, program):
+		"Runs a behaviour program (see behaviours.py) inside the simulation and waits until it finishes"
+		from behaviours import Behaviour
+		b = Behaviour(self.robot, program, self._process_command)
+		lockstep = self.robot.world.lockstep
+		if lockstep is None or self not in lockstep.targets:
+			self.robot.world.tasks.append(b.step)
+		else:
+			# In lockstep the controller does not hold the world back while the behaviour runs,
+			# and holds it again after the step where the behaviour finished
+			def step():
+				if b.step():
+					return True
+				lockstep.allow(self, self.robot.world.tick + 1)
+				return False
+			lockstep.allow(self, None)
+			self.robot.world.tasks.append(step)
+			result = b.wait()
+			# b finished at the start of a step: reply once the step is done, not while it runs
+			lockstep.reach(self, b.finished + 1)
+			return result
+		return b.wait()
+	
+	def _wheels(self, l, r):
+		"Applies WHEELS with up to 10% error in the settings (drawn in the simulation thread, in a reproducible order)"
+		n = self.robot.random
+		self.robot.wheels(l*n.uniform(0.9, 1.1), r*n.uniform(0.9, 1.1))
+
+	def _reset(self, seed):
+		"Handles RESET [seed]: the world starts a new match before the next step (see World.reset)"
+		world = self.robot.world
+		if not world.can_reset():
+			return "ERROR"
+		world.request_reset(seed)
+		return "OK"
+
+	def _step(self, n):
+		"Lets the simulation run n more steps and returns the tick once it has (see lockstep.py)"
+		world = self.robot.world
+		if world.lockstep is not None:
+			return world.lockstep.step(self, n)
+		target = world.tick + n
+		while world.tick < target:
+			time.sleep(0.001)
+		return world.tick
+	
 	def _process_command(self, cmd):
 		"Reaction to each command"
 		try:
@@ -296,11 +495,10 @@ class RobotServer:
 				l,r = int(c[1]), int(c[2])
 				if (l < -100 or l > 100 or r < -100 or r > 100):
 						return "ERROR"
-				# Introduce up to 10% error in settings
-				ltrue = l*random.uniform(0.9, 1.1)
-				rtrue = r*random.uniform(0.9, 1.1)
-				self.robot.wheels(ltrue, rtrue)
-				return "OK"
+				return str(self.actuation.put("WHEELS", l, r))
+			elif c[0] == "CAM" and len(c) > 1 and c[1] == "ALL":
+				balls = self.robot.camera_all()
+				return " ".join([str(len(balls))] + ["%f %f" % b for b in balls])
 			elif c[0] == "CAM":
 				c = self.robot.camera()
 				if c is None:
@@ -308,15 +506,25 @@ class RobotServer:
 				else:
 						return "%f %f" % c
 			elif c[0] == "GRAB":
-				self.robot.grab()
-				return "OK"
+				return str(self.actuation.put("GRAB"))
 			elif c[0] == "SHOOT":
-				self.robot.shoot()
-				return "OK"
+				return str(self.actuation.put("SHOOT"))
 			elif c[0] == "BEACON":
 				#return "1" if self.robot.beacon() else "0"
 				b = self.robot.beacon()
 				return "%f %f %f %f" % (b[0], b[1], b[2], b[3])
+			elif c[0] == "GOAL":
+				return "%f %f" % self.robot.goal()
+			elif c[0] == "BEHAVIOR":
+				return self._run_behaviour(cmd.split(None, 1)[1])
+			elif c[0] == "STEP":
+				return str(self._step(int(c[1]) if len(c) > 1 else 1))
+			elif c[0] == "TICK":
+				return str(self.robot.world.tick)
+			elif c[0] == "RESET":
+				return self._reset(int(c[1]) if len(c) > 1 else None)
+			elif c[0] == "MATCH":
+				return str(self.robot.world.match)
 			else:
 				return "ERROR"
 		except:
@@ -0,0 +1,113 @@
+"""
+Predictive ball tracking for the controllers.
+
+The camera reports the (distance, left) of the ball with up to 10% noise in each coordinate. BallTracker is a Kalman
+filter over the position of the ball in the robot's coordinates: between the camera readings it predicts how the ball
+moves relative to the robot from the robot's own commanded WHEELS speeds (the ball is assumed to stand still), and each
+reading is weighed against the prediction. So a controller may read the camera only every 50-100ms and act on the
+estimates in between, which are also smoother than the raw readings. See algorithm1.Algorithm.ball.
+A reading far off the prediction is taken to be another ball, and the tracking starts over from it.
+"""
+from math import sin, cos, sqrt
+
+SPEED = 1/500.0		# Wheel speed in pixels per ms for one unit of WHEELS (100 = 1 m/s = 0.2 px/ms)
+
+def _rotate(p, c, s):
+	"Returns M p M^T for the symmetric p = (ff, fl, ll) and the rotation M = [[c, s], [-s, c]]"
+	ff, fl, ll = p
+	return (c*c*ff + 2*c*s*fl + s*s*ll,
+			-c*s*ff + (c*c - s*s)*fl + c*s*ll,
+			s*s*ff - 2*c*s*fl + c*c*ll)
+
+class BallTracker:
+	"""
+	Tracks one ball. All times are in milliseconds, i.e. simulation steps.
+	  half_track - the robot turns by (left - right speed)/(2*half_track) radians per ms (telliskivi 21, spirit 20)
+	  noise      - the camera and the wheels multiply the true values by uniform(1 - noise, 1 + noise)
+	  drift      - variance (px^2) per ms of the unpredictable movement of the ball
+	  gate       - readings further than sqrt(gate) standard deviations from the prediction start a new track
+	>>> t = BallTracker()
+	>>> t.update(0, (100.0, 0.0))
+	>>> t.wheels(0, 50, 50)		# 0.1 px/ms forward
+	>>> [round(v, 3) for v in t.estimate(100)]
+	[90.0, 0.0]
+	>>> t.update(100, (95.0, 0.0))	# A noisy reading moves the estimate only a bit
+	>>> 90 < t.estimate(100)[0] < 95
+	True
+	>>> t.update(200, (300.0, 50.0))	# Another ball
+	>>> t.estimate(200)
+	(300.0, 50.0)
+	>>> t.update(300, None)
+	>>> t.estimate(300) is None
+	True
+	"""
+	def __init__(self, half_track=21, noise=0.1, drift=0.01, gate=16):
+		self.half_track = half_track
+		self.sigma = noise/sqrt(3)		# Standard deviation of uniform(1 - noise, 1 + noise)
+		self.drift = drift
+		self.gate = gate
+		self.t = 0
+		self.x = None		# (forward, left) of the ball at time t, None if no ball is tracked
+		self.p = None		# Covariance of x as (ff, fl, ll)
+		self.speeds = (0.0, 0.0)	# Commanded wheel speeds in px/ms
+
+	def wheels(self, t, left, right):
+		"Tells the tracker that the wheel speeds were set (in WHEELS units) at time t"
+		self.predict(t)
+		self.speeds = (left*SPEED, right*SPEED)
+
+	def lose(self):
+		"Stops tracking, e.g. when the ball was grabbed or shot"
+		self.x = None
+
+	def predict(self, t):
+		"Moves the estimate forward to time t, step by step as the robot moves in the simulator"
+		n = int(t - self.t)
+		if n <= 0:
+			return
+		self.t += n
+		if self.x is None:
+			return
+		l, r = self.speeds
+		v = (l + r)/2
+		turn = (l - r)/self.half_track/2
+		c, s = cos(turn), sin(turn)
+		f, lf = self.x
+		for i in range(n):
+			f -= v
+			f, lf = f*c + lf*s, -f*s + lf*c
+		self.x = (f, lf)
+		# The wheel errors are constant while a command lasts, hence they grow with the time squared
+		dist = sqrt(f*f + lf*lf)
+		q = (self.sigma*n)**2*(v*v + (turn*dist)**2) + self.drift*n
+		ff, fl, ll = _rotate(self.p, cos(n*turn), sin(n*turn))
+		self.p = (ff + q, fl, ll + q)
+
+	def update(self, t, reading):
+		"Takes a camera reading (forward, left) made at time t, None if no ball was seen"
+		self.predict(t)
+		if reading is None:
+			self.x = None
+			return
+		scale = self.x if self.x is not None else reading
+		rf, rl = (self.sigma*scale[0])**2 + 0.25, (self.sigma*scale[1])**2 + 0.25
+		if self.x is not None:
+			ff, fl, ll = self.p
+			yf, yl = reading[0] - self.x[0], reading[1] - self.x[1]
+			sff, sll = ff + rf, ll + rl
+			det = sff*sll - fl*fl
+			# Mahalanobis distance of the innovation, with S^-1 = [[sll, -fl], [-fl, sff]]/det
+			if (yf*yf*sll - 2*yf*yl*fl + yl*yl*sff)/det <= self.gate:
+				# K = P S^-1, x += K y, P -= K P
+				kff, kfl = (ff*sll - fl*fl)/det, (fl*sff - ff*fl)/det
+				klf, kll = (fl*sll - ll*fl)/det, (ll*sff - fl*fl)/det
+				self.x = (self.x[0] + kff*yf + kfl*yl, self.x[1] + klf*yf + kll*yl)
+				self.p = (ff - kff*ff - kfl*fl, fl - kff*fl - kfl*ll, ll - klf*fl - kll*ll)
+				return
+		self.x = (float(reading[0]), float(reading[1]))
+		self.p = (rf, 0.0, rl)
+
+	def estimate(self, t):
+		"Returns the predicted (forward, left) of the ball at time t, None if no ball is tracked"
+		self.predict(t)
+		return self.x
@@ -1,6 +1,4 @@
-import pygame,random
-from pygame.locals import *
-from pygame import draw
+import random, copy
 from math import sin, cos, sqrt
 
 # -------------- Utility class -------------------
@@ -126,14 +124,15 @@ class World:
 	It's main routines are:
 		* add_object	- registers a new object with the world.
 		* simulate		- perform a single simulation step. Typically about 50 steps should be done between frames.
-		* draw			- render the world on a pygame surface.
+		* draw			- render the world on a pygame surface (pygame is only needed for this one, see render.py).
+		* fork			- make a cheap simulation-only copy of the world, e.g. for lookahead rollouts.
+		* reset			- start a new match in place.
+	If sensor_engine is True, the camera/beacon/goal readings of all robots are computed in a single
+	vectorized pass at the end of each simulation step (requires numpy, see sensors.py).
+	The field is 900x600 pixels unless another size is given (e.g. for stress tests, see parallel.py).
 	Here's how it goes typically
-	>>> import pygame
 	>>> from telliskivi import Robot
-	>>> (_1, _2) = pygame.init()
-	>>> window = pygame.display.set_mode((1060, 760)) # This is the recommended size of the window (field + contestant area - (5300 x 3800 mm))
-	>>> screen = pygame.display.get_surface() 
-	>>> w = World(screen)
+	>>> w = World()
 	>>> w.width
 	900
 	>>> w.height
@@ -142,116 +141,263 @@ class World:
 	>>> w.add_object(Robot(w, "Robot", "TOPLEFT"))      # Add a robot
 	>>> for i in range(50):								# Simulate a bit
 	...    w.simulate()
+	>>> import pygame
+	>>> (_1, _2) = pygame.init()
+	>>> window = pygame.display.set_mode((1060, 760)) # This is the recommended size of the window (field + contestant area - (5300 x 3800 mm))
+	>>> screen = pygame.display.get_surface() 
 	>>> w.draw(screen)									# Draw on screen
 	
 	See also: WorldObject
 	"""
-	def __init__(self, screen):
+	CONTACT_GAP = 10
+
+	def __init__(self, sensor_engine=False, size=(900, 600)):
 		# Actual size of the field is 4500x3000. We make it 900x600 in pixels, which means each pixel is 5mm in reality
-		self.width, self.height = 900, 600
+		self.width, self.height = size
 		self.cx, self.cy = self.width/2, self.height/2
-		sw, sh = screen.get_size()
-		scx, scy = sw/2, sh/2
-		left, top = scx - self.width/2, scy - self.height/2
-		# Create a sub-image, containing the whole of the world in it.
-		self.screen = screen
-		self.font = pygame.font.Font(None, 60)
 		self.scoreLeft = 0
 		self.scoreRight = 0
-		self.field = screen.subsurface(Rect(left, top, self.width, self.height))
+		self.renderer = None	# Created on first draw(), see render.py
 		self.objects = [] # This will hold all the objects in the world
 		# Walls listed in clockwise order (in the right-hand coords)
 		self.walls = [Wall(Point(0,0), Point(0,self.height)), \
 					  Wall(Point(0,self.height), Point(self.width, self.height)),\
 					  Wall(Point(self.width, self.height), Point(self.width, 0)),\
 					  Wall(Point(self.width, 0), Point(0, 0))]
+		self.tick = 0	# Number of simulation steps performed so far
+		self.sensors = None
+		if sensor_engine:
+			from sensors import SensorEngine
+			self.sensors = SensorEngine(self)
+		self.metrics = None		# Optional metrics.Metrics collector, reported to by the main loop and the robot servers
+		self.tasks = []			# Callables run at the start of each step until they return False (e.g. server-side behaviours)
+		self.sensor_cache = (-1, {})	# (tick, values) for once_per_tick
+		self.events = None		# Optional events.EventLog, see log_event
+		self.lockstep = None	# Optional lockstep.Lockstep, see lockstep.py
+		self.next_id = 0		# Objects are numbered in the order they are added
+		self.new_match = None	# Optional callable(seed) returning the (x, y) of the balls of a new match, see reset
+		self.match = 0			# Number of resets so far
+		self.contacts = {}		# Last tick of every contact (pair of objects, or object and wall), see _contact_starts
+		self.contacts_pruned = 0
 	
 	def draw(self, screen):
-		# The field is a rect in the center of the screen
-		BLACK = (0,0,0)
-		WHITE = (255,255,255)
-		GREEN = (43,252,43)
-		self.field.fill(GREEN)	# Green fill
-		draw.rect(self.field, WHITE, self.field.get_rect(), 20)	# White border
-		draw.rect(self.field, BLACK, self.field.get_rect(), 1)		# Black border
-		draw.rect(self.field, BLACK, (10, 10, self.cx-5-10, self.height-10-10), 1)	# Black square (left)
-		draw.rect(self.field, BLACK, (self.cx + 5, 10, self.cx-5-10, self.height-10-10), 1)	# Black square (right)
-		draw.circle(self.field, WHITE, (self.cx, self.cy), 80, 10)	# Central circle (white)
-		draw.circle(self.field, BLACK, (self.cx, self.cy), 80-10, 1)		# Central circle (black, inner)
-		draw.circle(self.field, BLACK, (self.cx, self.cy), 80, 1)			# Central circle (black, outer)
-		draw.line(self.field, WHITE, (self.cx-1, 0+1), (self.cx-1, self.height-2),10)	# Central divider line (white)
+		"Renders the world on a pygame surface. This is the only place where World touches pygame (see render.py)"
+		if self.renderer is None or self.renderer.screen is not screen:
+			from render import Renderer
+			self.renderer = Renderer(self, screen)
+		self.renderer.draw()
+		
+	def add_object(self, obj):
+		"""The world manages a set of objects. Each object must have particular properties. The object gets a number as obj.id"""
+		obj.id = self.next_id
+		self.next_id += 1
+		self.objects.append(obj)
+	
+	def log_event(self, event, robot=None, ball=None, name="", args="", reply=""):
+		"Records an event of the current step into the event log, if there is one (see events.py)"
+		if self.events is not None:
+			self.events.log(self.tick, event, robot, ball, name, args, reply)
+	
+	def _contact_starts(self, a, b):
+		"""
+		Whether a contact of a and b (two objects, or an object and a wall) starts in this step. The checks report a contact
+		on every step it lasts, and a robot pushing against something may touch it every other step, so a contact counts as
+		new only after CONTACT_GAP steps without it. Then the event log gets one row per contact rather than one per step.
+		>>> w = World()
+		>>> a, b = Ball(Point(100, 100)), Ball(Point(200, 100))
+		>>> starts = []
+		>>> for i in range(30):
+		...     if i != 5 and i < 10 or i >= 25:
+		...         starts.append(w._contact_starts(b, a))
+		...     w.tick += 1
+		>>> starts.count(True)
+		2
+		"""
+		key = (a, b) if id(a) < id(b) else (b, a)
+		tick = self.tick
+		if tick - self.contacts_pruned > 1000:
+			self.contacts = dict((k, t) for (k, t) in self.contacts.iteritems() if tick - t <= self.CONTACT_GAP)
+			self.contacts_pruned = tick
+		last = self.contacts.get(key)
+		self.contacts[key] = tick
+		return last is None or tick - last > self.CONTACT_GAP
 
-		# Arcs
-		#1
-		draw.arc(self.field, WHITE, (10 - 100, 265 - 100, 200, 200), 0, 3.1415/2, 10)			# Left goal, upper arc, white filling
-		draw.arc(self.field, BLACK, (10 - 100, 265 - 100, 200, 200), 0, 3.1415/2, 1)			# Left goal, upper arc, black, outer
-		draw.arc(self.field, BLACK, (10 - 100 + 10, 265 - 100 + 10, 200 - 20, 200 - 20), 0, 3.1415/2, 1)	# Left goal, upper arc, black inner
+	def _log_wall(self, o, k):
+		"Records a contact of an object with the wall number k, reported by its wall_check"
+		if not self._contact_starts(o, self.walls[k]):
+			return
+		if isinstance(o, Ball):
+			self.log_event("wall", ball=o, name=str(k))
+		else:
+			self.log_event("wall", o, name=str(k))
+
+	def _log_collision(self, a, b):
+		"Records a collision of two objects, reported by their collision_check"
+		if not self._contact_starts(a, b):
+			return
+		if isinstance(a, Ball) and isinstance(b, Ball):
+			self.log_event("collision", ball=a, name=str(b.id))
+		elif isinstance(a, Ball):
+			self.log_event("collision", b, a)
+		elif isinstance(b, Ball):
+			self.log_event("collision", a, b)
+		else:
+			self.log_event("collision", a, name=b.name)
+	
+	def fork(self):
+		"""
+		Returns a copy of the physical state of the world (object poses, velocities, grabbed balls, scores).
+		The copy has no renderer and no sensor engine, it is meant to be simulated for a while and thrown away.
+		Use forked(obj) on the copy to find the counterpart of an object of the original world.
+		>>> w = World()
+		>>> b = Ball(Point(100, 100))
+		>>> b.v = Point(0.1, 0)
+		>>> w.add_object(b)
+		>>> f = w.fork()
+		>>> for i in range(100):
+		...    f.simulate()
+		>>> (f.forked(b).center.x > 105, b.center.x, f.tick, w.tick)
+		(True, 100, 100, 0)
+		"""
+		w = copy.copy(self)		# Shares the walls and the field geometry, which never change
+		w.renderer = None
+		w.sensors = None
+		w.metrics = None
+		w.events = None
+		w.lockstep = None
+		w.tasks = []
+		w.sensor_cache = (-1, {})
+		w.forks = {}
+		w.contacts = {}
+		w.objects = [w.forked(o) for o in self.objects]
+		return w
+	
+	def reset(self, seed=None):
+		"""
+		Starts a new match in place: re-seeds the random generator, replaces the balls with new ones at new_match(seed),
+		puts the robots back to their starting poses (robot.reset) and zeroes the scores. The objects are numbered
+		from 0 again, as in a new world. The tick goes on counting, the controllers see a reset as a change of match.
+		What was under way in the old match is dropped: the running behaviours finish with TIMEOUT and the queued
+		actuation commands are not applied (both check world.match). The event log, if any, continues in a new file
+		(see EventLog.new_match). Every robot must have reset(), see can_reset.
+		>>> from telliskivi import Robot
+		>>> w = World()
+		>>> w.new_match = lambda seed: [(300, 300), (600, 300)]
+		>>> w.add_object(Ball(Point(8, 300)))			# In the left goal
+		>>> r = Robot(w, "Robot", "TOPLEFT")
+		>>> w.add_object(r)
+		>>> r.wheels(50, 50)
+		>>> for i in range(100):
+		...    w.simulate()
+		>>> (w.scoreLeft, r.center.as_tuple())
+		(1, (47, 38))
+		>>> w.reset(1)
+		>>> (w.scoreLeft, r.center, [o.id for o in w.objects], w.match, w.tick)
+		(0, Point(38.000000, 38.000000), [0, 1, 2], 1, 100)
+		"""
+		random.seed(seed)
+		robots = [o for o in self.objects if not isinstance(o, Ball)]
+		self.objects = []
+		self.next_id = 0
+		for (x, y) in self.new_match(seed):
+			self.add_object(Ball(Point(x, y)))
+		for r in robots:
+			r.reset()
+			self.add_object(r)
+		self.scoreLeft = 0
+		self.scoreRight = 0
+		self.match += 1
+		self.contacts = {}
+		if self.events is not None:
+			self.events.new_match(self.match)
+		self.sensor_cache = (-1, {})
+		if self.sensors is not None:
+			self.sensors.update()
+		self.log_event("reset", name="" if seed is None else str(seed))
 
-		#2
-		draw.arc(self.field, WHITE, (10 - 100, 265 - 100 + 70, 200, 200), 3*3.1415/2, 2*3.1415, 10)			# Left goal, lower arc, white filling
-		draw.arc(self.field, BLACK, (10 - 100, 265 - 100 + 70, 200, 200), 3*3.1415/2, 2*3.1415, 1)			# Left goal, lower arc, black, outer
-		draw.arc(self.field, BLACK, (10 - 100 + 10, 265 - 100 + 10 + 70, 200 - 20, 200 - 20), 3*3.1415/4, 2*3.1415, 1)	# Left goal, lower arc, black inner
+	def can_reset(self):
+		"""
+		Whether reset() can start a new match: new_match must be given and every robot must have reset()
+		>>> w = World()
+		>>> w.new_match = lambda seed: []
+		>>> w.add_object(WorldObject(Point(10, 10), 5))
+		>>> w.can_reset()
+		False
+		"""
+		return self.new_match is not None and all([hasattr(o, 'reset') for o in self.objects if not isinstance(o, Ball)])
 
-		#3
-		draw.arc(self.field, WHITE, (self.width - 10 - 100, 265 - 100, 200, 200), 3.1415/2, 3.1415, 10)			# Right goal, upper arc, white filling
-		draw.arc(self.field, BLACK, (self.width - 10 - 100, 265 - 100, 200, 200), 3.1415/2, 3.1415,  1)			# Right goal, upper arc, black, outer
-		draw.arc(self.field, BLACK, (self.width - 10 - 100 + 10, 265 - 100 + 10, 200 - 20, 200 - 20), 3.1415/2, 3.1415, 1)	# Left goal, upper arc, black inner
+	def request_reset(self, seed=None):
+		"Resets the world (see reset) at the start of the next step. Safe to call from any thread, e.g. the robot servers."
+		self.tasks.append(lambda: self.reset(seed))	# Returns None, so it runs once
 
-		#4
-		draw.arc(self.field, WHITE, (self.width - 10 - 100, 265 - 100 + 70, 200, 200), 3.1415, 3*3.1415/2, 10)			# Right goal, lower arc, white filling
-		draw.arc(self.field, BLACK, (self.width - 10 - 100, 265 - 100 + 70, 200, 200), 3.1415, 3*3.1415/2, 1)			# Right goal, lower arc, black, outer
-		draw.arc(self.field, BLACK, (self.width - 10 - 100 + 10, 265 - 100 + 10 + 70, 200 - 20, 200 - 20),  3.1415, 3*3.1415/2, 1)	# Right goal, lower arc, black inner
-		
-		# Arc connectors
-		draw.line(self.field, WHITE, (10 + 100 - 5, 265), (10 + 100 - 5, 265 + 70), 10) # Left goal, arc connector, white filling
-		draw.line(self.field, BLACK, (10 + 100 - 10, 265), (10 + 100 - 10, 265 + 70), 1) # Left goal, arc connector, black inner
-		draw.line(self.field, BLACK, (10 + 100, 265), (10 + 100, 265 + 70), 1) # Left goal, arc connector, black outer
-		
-		draw.line(self.field, WHITE, (self.width - 10 - 100 + 5, 265), (self.width - 10 - 100 + 5, 265 + 70), 10) # Right goal, arc connector, white filling
-		draw.line(self.field, BLACK, (self.width - 10 - 100 + 10, 265), (self.width - 10 - 100 + 10, 265 + 70), 1) # Right goal, arc connector, black inner
-		draw.line(self.field, BLACK, (self.width - 10 - 100, 265), (self.width - 10 - 100, 265 + 70), 1) # Right goal, arc connector, black outer
-		
-		# Left goal
-		draw.rect(self.screen, (163, 163, 46), (self.field.get_offset()[0]-50, self.field.get_offset()[1]+self.cy-70, 50+10, 140), 0)
-		text = self.font.render(str(self.scoreLeft), True, BLACK, (163, 163, 46))
-		textRect = text.get_rect()
-		# Center the rectangle
-		textRect.centerx = self.field.get_offset()[0]-50 + 25 + 5
-		textRect.centery = self.field.get_offset()[1]+self.cy
-		# Blit the text
-		self.screen.blit(text, textRect)
-		
-		# Right goal
-		draw.rect(self.screen, (16, 57, 125), (self.field.get_offset()[0]+self.width-10, self.field.get_offset()[1]+self.cy-70, 50+10, 140), 0)
-		text = self.font.render(str(self.scoreRight), True, WHITE, (16, 57, 125))
-		textRect = text.get_rect()
-		textRect.centerx = self.field.get_offset()[0]+self.width - 10 + 30
-		textRect.centery = self.field.get_offset()[1]+self.cy
-		self.screen.blit(text, textRect)
-		
-		# Cross in the middle
-		#draw.line(self.field, BLACK, (self.cx-10, self.cy), (self.cx+10, self.cy))
-		#draw.line(self.field, BLACK, (self.cx, self.cy-10), (self.cx, self.cy+10))
-		
-		for o in self.objects:
-			o.draw(self.field)
-		
-	def add_object(self, obj):
-		"""The world manages a set of objects. Each object must have particular properties"""
-		self.objects.append(obj)
+	def forked(self, obj):
+		"In a forked world, returns the copy of the given object of the original world (copying it if necessary)"
+		c = self.forks.get(obj)
+		if c is None:
+			c = obj.fork(self)
+			self.forks[obj] = c
+		return c
+	
+	def once_per_tick(self, key, compute):
+		"""
+		Returns compute(), computed at most once per simulation step for the given key.
+		The robots use this for their sensor geometry, as the world does not change between steps.
+		"""
+		tick, values = self.sensor_cache
+		if tick != self.tick:
+			tick, values = self.tick, {}
+			self.sensor_cache = (tick, values)
+		if key not in values:
+			values[key] = compute()
+		return values[key]
+	
+	def ball_positions(self):
+		"Returns the (x, y) of every ball, for the sensor engine"
+		return [(o.center.x, o.center.y) for o in self.objects if isinstance(o, Ball)]
+	
+	def sensor_reading(self, robot):
+		"Returns the robot's precomputed SensorReading, or None if the sensor engine is not used"
+		if self.sensors is None:
+			return None
+		return self.sensors.reading(robot)
 		
 	def simulate(self):
-		for o in self.objects:
+		# Run the tasks first, so that anything they do takes effect in this step
+		for t in self.tasks[:]:
+			if not t():
+				self.tasks.remove(t)
+		# Balls at rest are put to sleep (see Ball.wake). Sleeping balls are not simulated and not checked
+		# against the walls or each other, we only check whether anything awake touches them.
+		awake = [o for o in self.objects if not getattr(o, 'asleep', False)]
+		sleeping = [o for o in self.objects if getattr(o, 'asleep', False)]
+		for o in awake:
 			o.simulate()
 		# Resolve collisions
-		# First the walls
-		for o in self.objects:
-			for w in self.walls:
-				o.wall_check(w)
+		# First the walls (the checks return True on contact, which goes into the event log)
+		events = self.events
+		for o in awake:
+			for (k, w) in enumerate(self.walls):
+				if o.wall_check(w) and events is not None:
+					self._log_wall(o, k)
 		# Then the collision among the objects
-		for i in range(len(self.objects)):
+		for i in range(len(awake)):
 			for j in range(0, i):
-				self.objects[i].collision_check(self.objects[j])
+				if awake[i].collision_check(awake[j]) and events is not None:
+					self._log_collision(awake[i], awake[j])
+		# Wake up the sleeping balls near a moving ball or a robot. The robots only push a ball while it is barely
+		# inside their edges, so the balls are woken a bit before anything can touch them (see Ball.WAKE_MARGIN).
+		for o in awake:
+			reach = getattr(o, 'bounding_radius', o.radius) + Ball.WAKE_MARGIN
+			for b in sleeping:
+				dx, dy = b.center.x - o.center.x, b.center.y - o.center.y
+				r = b.radius + reach
+				if dx*dx + dy*dy < r*r:
+					b.wake()
+					if o.collision_check(b) and events is not None:
+						self._log_collision(o, b)
+		for o in awake:
+			if isinstance(o, Ball) and o.rest_ticks >= Ball.SLEEP_TICKS and o.v.x == 0 and o.v.y == 0:
+				o.asleep = True
 		# Finally, see whether any of the balls fall into goals
 		i = 0
 		while i < len(self.objects):
@@ -262,16 +408,21 @@ class World:
 				if self.objects[i].center.y > self.cy - 70 and self.objects[i].center.y < self.cy + 70:
 					if self.objects[i].center.x < 5 + self.objects[i].radius:
 						# Left goal:
+						self.log_event("goal", ball=self.objects[i], name="LEFT")
 						del self.objects[i]
 						self.scoreLeft += 1
 					elif self.objects[i].center.x > self.width - 5 - self.objects[i].radius:
 						# Right goal
+						self.log_event("goal", ball=self.objects[i], name="RIGHT")
 						del self.objects[i]
 						self.scoreRight += 1
 					else:
 						i+=1
 				else:
 					i+=1
+		self.tick += 1
+		if self.sensors is not None:
+			self.sensors.update()
 			
 
 class WorldObject:
@@ -279,15 +430,37 @@ class WorldObject:
 	This is a sample "root class" that can be used as an item in the world,
 	(i.e. you can use world.add_object(o) for instances complying with this interface).
 	You don't have to inherit from this class, but you have to make sure the conditions listed here
-	are satisfied.
+	are satisfied. Robots may also have reset(), which puts them back to their starting pose for a new match
+	(see World.reset), otherwise the world cannot be reset.
 	"""
 	def __init__(self, center, radius):
-		"Every world object must have a center and radius for fallback collision detection. Note that coordinates are relative to the world."
+		"""
+		Every world object must have a center and radius for fallback collision detection. Note that coordinates are relative to the world.
+		An object whose shape does not fit into the circle of that radius must also have a bounding_radius which encloses it.
+		"""
 		self.center = center
 		self.radius = radius
 	def draw(self, screen):
 		"Draws the object on screen"
 		pass
+	def fork(self, world):
+		"""
+		Returns a copy of the object for the forked world (see World.fork). The copy must not share any mutable
+		state with the original. References to other objects must be translated using world.forked(obj).
+		By default it is a shallow copy with its own center, which objects holding other mutable state must override.
+		>>> w = World()
+		>>> o = WorldObject(Point(10, 10), 5)
+		>>> w.add_object(o)
+		>>> f = w.fork()
+		>>> c = f.forked(o)
+		>>> c.center.add(Point(1, 0))
+		>>> (c.center.x, o.center.x, c.world is f)
+		(11, 10, True)
+		"""
+		c = copy.copy(self)
+		c.center = Point(self.center.x, self.center.y)
+		c.world = world
+		return c
 	def simulate(self):
 		"Performs one step of object physics simulation. This is ALWAYS called before wall_check and collision_check"
 		pass
@@ -295,12 +468,15 @@ class WorldObject:
 		"""
 		Given a wall object, checks for a collision and updates state, if necessary.
 		Always called after simulate (i.e. you may precompute something there).
+		May return True if there was a collision, for the event log (see World.log_event).
 		"""
 		pass
 	def collision_check(self, o):
 		"""
 		Given any non-wall object, checks for a collision and updates state of this and colliding object, if necessary.
 		Always called after simulate (i.e. may precompute something there).
+		May return True if there was a collision, for the event log (see World.log_event). Contacts which are logged
+		as something else (e.g. a grab) should not return True.
 		"""
 		pass
 		
@@ -310,11 +486,42 @@ class WorldObject:
 # Robot is given in <your_robot_name>.py
 
 class Ball(WorldObject):
-	"""The ball is the most basic world object"""
+	"""
+	The ball is the most basic world object.
+	A ball which has been standing still for SLEEP_TICKS steps is put to sleep by the world and is not simulated until
+	something touches it. Whoever sets the velocity or position of a ball directly (e.g. a robot shooting it) must call wake().
+	>>> from spirit import Robot
+	>>> w = World()
+	>>> r = Robot(w, "S", "TOPLEFT")		# At (32, 32), facing (1, 0)
+	>>> b = Ball(Point(200, 55))			# In the way of the robot's front right corner
+	>>> w.add_object(b); w.add_object(r)
+	>>> for i in range(30):
+	...     w.simulate()
+	>>> b.asleep
+	True
+	>>> r.wheels(100, 100)
+	>>> for i in range(1000):
+	...     w.simulate()
+	>>> b.center.x > 200
+	True
+	"""
+	SLEEP_TICKS = 20
+	WAKE_MARGIN = 4		# Sleeping balls are woken this many pixels before a moving object's bounding circle reaches them
 	def __init__(self, center, radius = 4.3):	# Actual radius is 43/2 mm, i.e. 4.3 pixels
 		WorldObject.__init__(self, center, radius)
 		self.v = Point(0, 0)	# Speed
+		self.asleep = False
+		self.rest_ticks = 0		# Number of steps the ball has been standing still
+	def wake(self):
+		self.asleep = False
+		self.rest_ticks = 0
+	def fork(self, world):
+		b = copy.copy(self)
+		b.center = Point(self.center.x, self.center.y)
+		b.v = Point(self.v.x, self.v.y)
+		return b
 	def draw(self, screen):
+		from pygame import draw
 		ORANGE = (255,60,0)
 		draw.circle(screen, ORANGE, self.center.as_tuple(), int(self.radius))
 	def simulate(self):
@@ -323,7 +530,10 @@ class Ball(WorldObject):
 		# -0.25 m/s^2. This is equal to 250 mm / 1mln ms^2 = 50pixels / 1000000 ms^2 = 0.00005 px/ms^2
 		FRICTION_FORCE = 0.00005
 		n = self.v.norm()
-		if (n > 0):
+		if (n == 0):
+			self.rest_ticks += 1
+		else:
+			self.rest_ticks = 0
 			# Move
 			self.center.add(self.v)
 			# Account for friction
@@ -344,6 +554,7 @@ class Ball(WorldObject):
 			wall_v = self.v.inner_product(w.normal)
 			if wall_v < 0:
 				self.v.add(w.normal*(-2*wall_v))
+				return True
 	def collision_check(self, obj):
 		# If object is not a Ball, then let him do the collision computation
 		if (not isinstance(obj, Ball)):
@@ -367,6 +578,7 @@ class Ball(WorldObject):
 					steal_v = direction_normalized*towards_v
 					obj.v.add(steal_v*(-1))
 					self.v.add(steal_v)
+					return True
 
 if __name__ == "__main__":
 	# Run doctests (hint, run with -v for verbose output)